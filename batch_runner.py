@@ -0,0 +1,121 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from main import build_parser, connector_options, create_metadata_cache, create_summarizer, export_metrics, run_report
+from metrics import profiling
+from notion_connector import NotionConnector, create_session
+
+logger = logging.getLogger("batch_runner")
+
+def parse_args(argv=None):
+    parser = build_parser()
+    parser.description = "Notion AI Assistant - headless batch runner"
+    parser.add_argument("job_file",
+                        help="JSON file with a list of jobs: {\"source_id\", \"instruction\", \"title\"}")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of jobs run concurrently")
+    parser.add_argument("--output", default=None,
+                        help="Also write the per-job status JSON to this file")
+    args = parser.parse_args(argv)
+    if args.replay or args.save_snapshot:
+        # A snapshot holds one source, a job file many
+        parser.error("--replay/--save-snapshot work on a single source; run main.py for each job instead")
+    return args
+
+def load_jobs(path):
+    """
+    Reads the job file: a JSON list of jobs, or an object with a "jobs" list.
+    Each job needs "instruction"; "source_id" defaults to NOTION_DATABASE_ID and "title" to 'AI Report'.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    jobs = data["jobs"] if isinstance(data, dict) else data
+
+    normalized = []
+    for i, job in enumerate(jobs):
+        if not job.get("instruction", "").strip():
+            raise ValueError(f"Job {i + 1} has no instruction")
+        normalized.append({
+            "id": str(job.get("id") or i + 1),
+            "source_id": job.get("source_id") or os.environ["NOTION_DATABASE_ID"],
+            "instruction": job["instruction"],
+            "title": job.get("title") or "AI Report",
+        })
+    return normalized
+
+def run_job(job, args, session, summarizer, metadata_cache=None):
+    """
+    Runs one job with the shared session/summarizer. Never raises: failures are reported in the status.
+    """
+    started = time.time()
+    status = {"id": job["id"], "source_id": job["source_id"], "title": job["title"]}
+    notion = None
+    try:
+        # The session pools connections across jobs; the rate limiter is shared per token automatically
+        notion = NotionConnector(source_id=job["source_id"], session=session,
+                                 **connector_options(args, metadata_cache))
+        if notion.source_type == "unknown":
+            status.update({"status": "failed", "pages": 0, "report_page_id": None,
+                           "error": "Could not identify source ID"})
+        else:
+            status.update(run_report(notion, summarizer, job["instruction"], job["title"], args))
+    except Exception as e:
+        logger.error(f"Job {job['id']} failed: {e}")
+        status.update({"status": "failed", "error": str(e)})
+    finally:
+        if notion is not None:
+            notion.close()
+    status["elapsed_seconds"] = round(time.time() - started, 2)
+    logger.info(f"Job {job['id']} ({job['title']}): {status['status']}")
+    return status
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv()
+    # stdout is reserved for the machine-readable result; logs go to stderr
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)],
+        force=True
+    )
+    # Interleaved progressive output makes no sense for concurrent jobs
+    args.stream = False
+
+    jobs = load_jobs(args.job_file)
+    logger.info(f"Running {len(jobs)} jobs ({args.workers} at a time)...")
+
+    # One connection pool for every job (each connector runs up to 8 block requests at once)
+    session = create_session(pool_size=max(1, args.workers) * max(1, args.max_concurrency))
+    summarizer = create_summarizer(args)
+    metadata_cache = create_metadata_cache(args)
+    try:
+        with contextlib.redirect_stdout(sys.stderr), profiling(args.profile, trace_memory=args.trace_memory):
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+                statuses = list(executor.map(lambda job: run_job(job, args, session, summarizer, metadata_cache), jobs))
+    finally:
+        session.close()
+        summarizer.close()
+        # Metrics cover all jobs of the batch together
+        export_metrics(args)
+
+    report = {
+        "jobs": statuses,
+        "succeeded": sum(1 for s in statuses if s["status"] in ("ok", "empty", "planned")),
+        "failed": sum(1 for s in statuses if s["status"] == "failed"),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
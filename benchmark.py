@@ -0,0 +1,195 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fake_gemini import FakeGenaiClient
+from fake_notion import FakeNotionServer, FakeWorkspace
+from main import build_parser, connector_options, create_summarizer, run_report
+from metrics import endpoint_name, metrics
+from notion_connector import NotionConnector
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger("benchmark")
+
+
+def parse_args(argv=None):
+    parser = build_parser()
+    parser.description = "Offline benchmark: full runs against a fake Notion server and a fake Gemini client"
+    workspace = parser.add_argument_group("synthetic workspace")
+    workspace.add_argument("--pages", type=int, default=50, help="Number of pages (N)")
+    workspace.add_argument("--depth", type=int, default=2, help="Block nesting depth per page (D)")
+    workspace.add_argument("--fanout", type=int, default=3, help="Nested blocks per level (F)")
+    workspace.add_argument("--paragraphs", type=int, default=8, help="Text blocks at the top level of a page")
+    workspace.add_argument("--source", choices=("database", "page"), default="database",
+                           help="Read the pages from a database or from child pages of a root page")
+    workspace.add_argument("--seed", type=int, default=0)
+    fakes = parser.add_argument_group("fake services")
+    fakes.add_argument("--notion-latency", type=float, default=0.05, help="Seconds added to every Notion response")
+    fakes.add_argument("--notion-jitter", type=float, default=0.02, help="Extra random latency (0..N seconds)")
+    fakes.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of Notion requests answered with 429")
+    fakes.add_argument("--retry-after", type=float, default=0.2, help="Retry-After seconds on injected 429s")
+    fakes.add_argument("--notion-rate", type=float, default=0.0,
+                       help="Client rate limit in requests/second (0 = unlimited, 3 = Notion's real limit)")
+    fakes.add_argument("--gemini-latency", type=float, default=0.3, help="Seconds per fake Gemini call")
+    fakes.add_argument("--gemini-quota-rate", type=float, default=0.0, help="Fraction of Gemini calls failing with 429")
+    fakes.add_argument("--gemini-rpm", type=int, default=None,
+                       help="Per-model requests per minute of the fake Gemini (calls beyond it get a 429 with retryDelay)")
+    parser.add_argument("--runs", type=int, default=1,
+                        help="Repeat the run (later runs are warm if the caches are enabled)")
+    parser.add_argument("--instruction", default="핵심 내용을 요약해줘")
+    parser.add_argument("--output", default=None, help="Also write the benchmark report JSON to this file")
+    return parser.parse_args(argv)
+
+
+class RecordingSession(requests.Session):
+    """
+    requests.Session that records the client-side latency of every request per endpoint.
+    """
+    def __init__(self, pool_size=10):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.latencies = {}
+
+    def request(self, method, url, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().request(method, url, *args, **kwargs)
+        finally:
+            self.latencies.setdefault(endpoint_name(method, url), []).append(time.perf_counter() - started)
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Nearest-rank percentiles in milliseconds.
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {f"p{p}_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 2) for p in points}
+    result["max_ms"] = round(ordered[-1] * 1000, 2)
+    result["count"] = len(ordered)
+    return result
+
+
+def run_once(args, server, client):
+    """
+    One full run (fetch -> extract -> summarize -> upload) against the fakes. Returns the run report.
+    """
+    metrics.reset()
+    server.reset_counts()
+    client.models.reset_counts()
+
+    session = RecordingSession(pool_size=max(16, args.max_concurrency))
+    rate = args.notion_rate or 1e9
+    # The 32-character form users copy from a URL (the API answers with dashed IDs)
+    notion = NotionConnector(source_id=server.workspace.source_id.replace("-", ""), base_url=server.base_url,
+                             session=session, rate_limiter=TokenBucket(rate=rate, burst=max(5, rate)),
+                             **connector_options(args))
+    summarizer = create_summarizer(args, client=client)
+
+    started = time.perf_counter()
+    try:
+        result = run_report(notion, summarizer, args.instruction, "Benchmark Report", args)
+    finally:
+        elapsed = time.perf_counter() - started
+        notion.close()
+        summarizer.close()
+        if summarizer.cache:
+            summarizer.cache.close()
+
+    status = result["status"]
+    # Regression check: every database row must reach the report (no page lost between stages).
+    # Per-page runs skip unchanged pages and the relevance filter drops pages on purpose.
+    if args.source == "database" and not (args.per_page or args.top_k or args.min_relevance):
+        expected = args.pages
+        if status == "ok" and result["pages"] != expected:
+            logging.getLogger(__name__).error(f"Report covered {result['pages']} of {expected} pages.")
+            status = "incomplete"
+
+    all_latencies = [s for samples in session.latencies.values() for s in samples]
+    return {
+        "status": status,
+        "pages": result["pages"],
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(result["pages"] / elapsed, 2) if elapsed else None,
+        "notion": {
+            "requests": sum(server.calls.values()),
+            "throttled": server.throttled,
+            "calls": dict(sorted(server.calls.items())),
+            "latency": percentiles(all_latencies),
+            "latency_by_endpoint": {name: percentiles(samples) for name, samples in sorted(session.latencies.items())},
+        },
+        "gemini": {
+            "calls": dict(client.models.calls),
+            "quota_errors": client.models.quota_errors,
+            "max_concurrent": client.models.max_in_flight,
+            "latency": percentiles(client.models.latencies),
+        },
+        "metrics": metrics.report(),
+    }
+
+
+def print_report(report):
+    ws = report["workspace"]
+    print(f"\nWorkspace: {ws['pages']} pages, {ws['blocks']} blocks (depth {ws['depth']}, fan-out {ws['fanout']}, {ws['source']})")
+    for i, run in enumerate(report["runs"], 1):
+        notion, gemini = run["notion"], run["gemini"]
+        print(f"Run {i}: {run['status']}, {run['pages']} pages in {run['seconds']:.2f}s ({run['pages_per_second']} pages/s)")
+        print(f"   Notion: {notion['requests']} requests ({notion['throttled']} throttled), "
+              f"latency p50 {notion['latency'].get('p50_ms')} ms / p90 {notion['latency'].get('p90_ms')} ms / "
+              f"p99 {notion['latency'].get('p99_ms')} ms")
+        for name, count in notion["calls"].items():
+            print(f"      {count:>6}  {name}")
+        print(f"   Gemini: {sum(gemini['calls'].values())} calls (max {gemini['max_concurrent']} concurrent, "
+              f"{gemini['quota_errors']} quota errors), latency p50 {gemini['latency'].get('p50_ms')} ms")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)],
+        force=True
+    )
+    # Nothing is sent to the real services
+    os.environ.setdefault("NOTION_TOKEN", "benchmark")
+    args.stream = False
+
+    workspace = FakeWorkspace(seed=args.seed).build(
+        pages=args.pages, depth=args.depth, fanout=args.fanout, paragraphs=args.paragraphs, source=args.source
+    )
+    client = FakeGenaiClient(latency=args.gemini_latency, quota_rate=args.gemini_quota_rate, seed=args.seed,
+                             rpm=args.gemini_rpm)
+    server = FakeNotionServer(workspace, latency=args.notion_latency, jitter=args.notion_jitter,
+                              throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+
+    report = {
+        "workspace": {"pages": args.pages, "depth": args.depth, "fanout": args.fanout,
+                      "source": args.source, "blocks": workspace.block_count},
+        "runs": [],
+    }
+    # Caches live in a temp dir so runs never touch (or benefit from) the real .cache/
+    # (report previews printed by run_report go to stderr, stdout is the benchmark report)
+    with tempfile.TemporaryDirectory() as cache_dir, server, contextlib.redirect_stdout(sys.stderr):
+        os.environ["NOTION_CACHE_DIR"] = cache_dir
+        for _ in range(max(1, args.runs)):
+            report["runs"].append(run_once(args, server, client))
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if all(run["status"] in ("ok", "planned") for run in report["runs"]) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import metrics
+from renderers import RENDER_VERSION
+
+# Local cache directory next to the scripts (ignored by git)
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+def default_cache_path(filename):
+    # NOTION_CACHE_DIR moves every cache elsewhere (e.g. a temp dir for benchmarks)
+    cache_dir = os.environ.get("NOTION_CACHE_DIR") or DEFAULT_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, filename)
+
+
+class PageCache:
+    """
+    Persistent page store (SQLite) for incremental sync.
+    Keeps each page's last_edited_time, properties and extracted text, so unchanged
+    pages are served locally instead of re-downloading their block trees. Text rendered by
+    another RENDER_VERSION is treated as stale.
+    """
+    def __init__(self, source_id, path=None, refresh=False):
+        self.source_id = source_id
+        self.path = path or default_cache_path("pages.db")
+        # refresh: ignore what's stored (still writes fresh results)
+        self.refresh = refresh
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                source_id TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                last_edited_time TEXT NOT NULL,
+                properties TEXT,
+                content TEXT,
+                updated_at REAL,
+                nested TEXT,
+                render_version INTEGER,
+                PRIMARY KEY (source_id, page_id)
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(pages)")}
+        if "nested" not in columns:
+            # Cache written before nested pages were recorded: those rows read as 'unknown'
+            self.conn.execute("ALTER TABLE pages ADD COLUMN nested TEXT")
+        if "render_version" not in columns:
+            # Rows written before the version was stored never match it, so they are re-read
+            self.conn.execute("ALTER TABLE pages ADD COLUMN render_version INTEGER")
+        self.conn.commit()
+
+    def get(self, page_id, last_edited_time):
+        """
+        Returns the cached text if the page hasn't been edited since it was stored, else None.
+        """
+        entry = self.get_entry(page_id, last_edited_time)
+        return entry[0] if entry else None
+
+    def get_entry(self, page_id, last_edited_time, require_nested=False):
+        """
+        (text, nested) if the page hasn't been edited since it was stored, else None.
+        nested: the child pages/databases found in the page's blocks (None if not recorded;
+        require_nested treats such rows as misses).
+        """
+        if self.refresh or not last_edited_time:
+            self.misses += 1
+            return None
+        query = ("SELECT content, nested FROM pages "
+                 "WHERE source_id = ? AND page_id = ? AND last_edited_time = ? AND render_version = ?")
+        if require_nested:
+            query += " AND nested IS NOT NULL"
+        with self.lock:
+            row = self.conn.execute(query, (self.source_id, page_id, last_edited_time, RENDER_VERSION)).fetchone()
+        if row is None:
+            self.misses += 1
+            metrics.count("page_cache.misses")
+            return None
+        self.hits += 1
+        metrics.count("page_cache.hits")
+        return row[0], json.loads(row[1]) if row[1] is not None else None
+
+    def put(self, page, content, nested=None):
+        """
+        Stores (or replaces) a page's properties and extracted text, and optionally the
+        child pages/databases found in it (page mode re-checks those without walking the page).
+        """
+        last_edited_time = page.get("last_edited_time")
+        if not last_edited_time:
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(source_id, page_id, last_edited_time, properties, content, updated_at, nested, render_version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.source_id, page["id"], last_edited_time,
+                 json.dumps(page.get("properties", {}), ensure_ascii=False), content, time.time(),
+                 json.dumps(nested, ensure_ascii=False) if nested is not None else None, RENDER_VERSION)
+            )
+            self.conn.commit()
+
+    def evict_missing(self, seen_page_ids):
+        """
+        Deletes pages of this source that were not seen in a complete listing (deleted/archived in Notion).
+        Returns the number of evicted pages.
+        """
+        seen = set(seen_page_ids)
+        with self.lock:
+            stored = [row[0] for row in self.conn.execute(
+                "SELECT page_id FROM pages WHERE source_id = ?", (self.source_id,))]
+            missing = [page_id for page_id in stored if page_id not in seen]
+            self.conn.executemany(
+                "DELETE FROM pages WHERE source_id = ? AND page_id = ?",
+                [(self.source_id, page_id) for page_id in missing]
+            )
+            self.conn.commit()
+        if missing:
+            self.logger.info(f"Evicted {len(missing)} deleted pages from cache.")
+        return len(missing)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def response_key(*parts):
+    """
+    Content address of an LLM request: SHA-256 over its parts (model, template, instruction, input).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = (part or "").encode("utf-8")
+        # Length prefix keeps ('ab', 'c') and ('a', 'bc') apart
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk LLM response cache (SQLite), keyed by response_key().
+    Entries expire after ttl seconds; past max_bytes the least recently used are evicted.
+    """
+    def __init__(self, path=None, ttl=30 * 24 * 3600, max_bytes=200 * 1024 * 1024):
+        self.path = path or default_cache_path("responses.db")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response, model=None):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now)
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """
+        Drops expired entries, then least recently used ones until the cache fits in max_bytes.
+        """
+        if self.ttl:
+            cursor = self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            self.evictions += max(cursor.rowcount, 0)
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SourceMetadataCache:
+    """
+    On-disk cache of source detection (SQLite), keyed by source id: the source type
+    ('database' / 'page') and, for databases, the full property schema from GET /databases/{id}.
+    Warm starts need no detection requests; entries older than ttl seconds are re-fetched.
+    """
+    def __init__(self, path=None, ttl=24 * 3600, refresh=False):
+        self.path = path or default_cache_path("sources.db")
+        self.ttl = ttl
+        self.refresh = refresh
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                source_id TEXT PRIMARY KEY,
+                source_type TEXT NOT NULL,
+                schema TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, source_id):
+        """
+        Returns (source_type, schema dict or None) if cached and fresh, else None.
+        """
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT source_type, schema, fetched_at FROM sources WHERE source_id = ?", (source_id,)
+            ).fetchone()
+        if row is None or (self.ttl and time.time() - row[2] > self.ttl):
+            metrics.count("source_cache.misses")
+            return None
+        metrics.count("source_cache.hits")
+        return row[0], json.loads(row[1]) if row[1] else None
+
+    def put(self, source_id, source_type, schema=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (source_id, source_type, schema, fetched_at) VALUES (?, ?, ?, ?)",
+                (source_id, source_type, json.dumps(schema, ensure_ascii=False) if schema is not None else None, time.time())
+            )
+            self.conn.commit()
+
+    def invalidate(self, source_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM sources WHERE source_id = ?", (source_id,))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class WatchState:
+    """
+    Persistent high-water mark of watch mode (SQLite): the last_edited_time up to which
+    every page of a source has been handled. Survives restarts.
+    """
+    def __init__(self, source_id, path=None):
+        self.source_id = source_id
+        self.path = path or default_cache_path("watch.db")
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS watch_state (
+                source_id TEXT PRIMARY KEY,
+                high_water TEXT,
+                updated_at REAL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT high_water FROM watch_state WHERE source_id = ?", (self.source_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, high_water):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO watch_state (source_id, high_water, updated_at) VALUES (?, ?, ?)",
+                (self.source_id, high_water, time.time())
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def content_hash(*parts):
+    """
+    Stable hash of page content (plus anything else that should invalidate a summary).
+    """
+    return response_key(*parts)
+
+
+class SummaryIndex:
+    """
+    Local index of per-page summaries: page id -> (content hash, summary page id).
+    Lets per-page runs skip pages whose content hasn't changed since they were last summarized.
+    """
+    def __init__(self, source_id, path=None):
+        self.source_id = source_id
+        self.path = path or default_cache_path("summaries.db")
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                source_id TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                summary_page_id TEXT,
+                updated_at REAL,
+                PRIMARY KEY (source_id, page_id)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, page_id):
+        """
+        Returns (content_hash, summary_page_id) of the last summary, or None.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT content_hash, summary_page_id FROM summaries WHERE source_id = ? AND page_id = ?",
+                (self.source_id, page_id)
+            ).fetchone()
+
+    def put(self, page_id, digest, summary_page_id):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (source_id, page_id, content_hash, summary_page_id, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.source_id, page_id, digest, summary_page_id, time.time())
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,190 @@
+import logging
+import tempfile
+import threading
+
+from token_budget import estimate_tokens
+
+
+_RULE = "=" * 50
+_SEPARATOR = "-" * 50
+
+
+def format_document(title, props_text, content):
+    """
+    Formats one page (Title + Properties + Content) as a document for the prompt.
+    """
+    return (
+        f"{_RULE}\n"
+        f"PAGE TITLE: {title}\n"
+        f"{_SEPARATOR}\n"
+        f"[Page Properties]\n{props_text}\n"
+        f"{_SEPARATOR}\n"
+        f"[Page Content]\n{content}\n"
+        f"{_RULE}\n"
+    )
+
+
+def split_document(document):
+    """
+    Inverse of format_document: (title, props_text, content).
+    """
+    head, content = document.split(f"\n{_SEPARATOR}\n[Page Content]\n", 1)
+    head, props_text = head.split(f"\n{_SEPARATOR}\n[Page Properties]\n", 1)
+    title = head[len(f"{_RULE}\nPAGE TITLE: "):]
+    return title, props_text, content[:-len(f"\n{_RULE}\n")]
+
+
+class CorpusBuilder:
+    """
+    Append-only store of per-page documents with bounded memory.
+    Records are kept in memory until spill_threshold bytes, then everything moves to an
+    anonymous temp file and only an offset index stays in memory. Documents are read back
+    lazily (iter_records / iteration), so the whole corpus is never materialized as one string.
+    """
+    def __init__(self, estimator=None, spill_threshold=16 * 1024 * 1024):
+        self.estimate = estimator.estimate if estimator else estimate_tokens
+        self.spill_threshold = spill_threshold
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+
+        self.titles = []
+        self.page_ids = []
+        self.token_counts = []
+        self.char_counts = []
+        self.total_chars = 0
+        self.total_tokens = 0
+
+        self._memory = [] # documents while not spilled
+        self._memory_bytes = 0
+        self._file = None # temp file once spilled
+        self._index = [] # (offset, length) per record once spilled
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def add(self, title, props_text, content, page_id=None):
+        """
+        Formats and appends one page. Returns the formatted document's token estimate.
+        """
+        document = format_document(title, props_text, content)
+        tokens = self.estimate(document)
+        with self.lock:
+            self.titles.append(title)
+            self.page_ids.append(page_id)
+            self.token_counts.append(tokens)
+            self.char_counts.append(len(document))
+            self.total_chars += len(document)
+            self.total_tokens += tokens
+
+            if self._file is None:
+                self._memory.append(document)
+                self._memory_bytes += len(document.encode("utf-8"))
+                if self._memory_bytes > self.spill_threshold:
+                    self._spill()
+            else:
+                self._append_to_file(document)
+        return tokens
+
+    def _spill(self):
+        self.logger.info(f"Corpus over {self.spill_threshold // (1024 * 1024)} MB, spilling to a temp file...")
+        self._file = tempfile.TemporaryFile()
+        for document in self._memory:
+            self._append_to_file(document)
+        self._memory = []
+        self._memory_bytes = 0
+
+    def _append_to_file(self, document):
+        data = document.encode("utf-8")
+        self._file.seek(0, 2)
+        self._index.append((self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def get(self, i):
+        """
+        Returns document i.
+        """
+        with self.lock:
+            if self._file is None:
+                return self._memory[i]
+            offset, length = self._index[i]
+            self._file.seek(offset)
+            return self._file.read(length).decode("utf-8")
+
+    def iter_records(self, indexes=None):
+        """
+        Yields documents in order (or only the given indexes), one at a time.
+        """
+        for i in (range(len(self)) if indexes is None else indexes):
+            yield self.get(i)
+
+    def page_tokens(self):
+        """
+        [(title, tokens)] per record, for token planning.
+        """
+        return list(zip(self.titles, self.token_counts))
+
+    def stats(self):
+        return {
+            "records": len(self),
+            "chars": self.total_chars,
+            "tokens": self.total_tokens,
+            "spilled": self.spilled,
+        }
+
+    def subset(self, indexes):
+        """
+        Read-only view of the given records (e.g. after the relevance filter), nothing is copied.
+        """
+        return CorpusSubset(self, indexes)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory = []
+
+
+class CorpusSubset:
+    """
+    Some records of a CorpusBuilder, in their original order, with the same reading interface
+    (titles, page_ids, token counts, iteration, page_tokens) so planning and summarizing don't
+    need to know the corpus was filtered.
+    """
+    def __init__(self, corpus, indexes):
+        self.corpus = corpus
+        self.indexes = sorted(indexes)
+        self.titles = [corpus.titles[i] for i in self.indexes]
+        self.page_ids = [corpus.page_ids[i] for i in self.indexes]
+        self.token_counts = [corpus.token_counts[i] for i in self.indexes]
+        self.char_counts = [corpus.char_counts[i] for i in self.indexes]
+        self.total_chars = sum(self.char_counts)
+        self.total_tokens = sum(self.token_counts)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def get(self, i):
+        return self.corpus.get(self.indexes[i])
+
+    def iter_records(self, indexes=None):
+        for i in (range(len(self)) if indexes is None else indexes):
+            yield self.get(i)
+
+    def page_tokens(self):
+        return list(zip(self.titles, self.token_counts))
+
+    def subset(self, indexes):
+        return CorpusSubset(self.corpus, [self.indexes[i] for i in indexes])
+
+    def close(self):
+        self.corpus.close()
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+from collections import Counter
+
+import numpy as np
+
+from corpus import CorpusBuilder, split_document
+from metrics import metrics
+
+_PRIME = (1 << 61) - 1
+
+
+def _hash32(text):
+    # Stable across runs (unlike hash()), so the same corpus always dedups the same way
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def line_key(line):
+    """
+    Hash of a rendered line (one block) with case and whitespace normalized; None for blank lines.
+    """
+    normalized = " ".join(line.split()).lower()
+    return _hash32(normalized) if normalized else None
+
+
+class Deduplicator:
+    """
+    Shrinks a corpus before summarization:
+    1. Template boilerplate: lines (blocks) found on at least boilerplate_share of the pages
+       (and min_pages pages) are stripped everywhere, as are lines repeated within a page.
+    2. Near-duplicate pages: MinHash signatures over word shingles, bucketed with LSH; a page
+       whose estimated Jaccard similarity to an earlier page reaches `similarity` keeps its title
+       and properties but its content is replaced by a reference to that page.
+    """
+    def __init__(self, similarity=0.9, boilerplate_share=0.5, min_pages=3, shingle_size=3,
+                 num_perm=64, bands=16, seed=1):
+        self.similarity = similarity
+        self.boilerplate_share = boilerplate_share
+        self.min_pages = min_pages
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        # (a * h + b) mod p stays below 2**64 for 32-bit a, b, h
+        self._a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+        self.logger = logging.getLogger(__name__)
+
+    def signature(self, text):
+        """
+        MinHash signature of the text's word shingles (None if the text is too short to compare).
+        """
+        words = text.split()
+        if len(words) < self.shingle_size:
+            return None
+        shingles = {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        hashes = np.fromiter((_hash32(s) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def run(self, corpus, estimator=None):
+        """
+        Returns (deduplicated CorpusBuilder, report dict). Two passes over the corpus documents
+        (read lazily, so a spilled corpus stays on disk).
+        """
+        n = len(corpus)
+        # Pass 1: on how many pages each line appears
+        line_pages = Counter()
+        for document in corpus:
+            content = split_document(document)[2]
+            line_pages.update({key for key in map(line_key, content.split("\n")) if key is not None})
+        min_pages = max(self.min_pages, self.boilerplate_share * n)
+        boilerplate = {key for key, pages in line_pages.items() if pages >= min_pages}
+        del line_pages
+
+        # Pass 2: strip lines, then collapse near-duplicates onto the first similar page
+        result = CorpusBuilder(estimator=estimator)
+        signatures = {} # corpus index -> signature of a page kept in full
+        buckets = {} # (band, band hash) -> corpus indexes
+        lines_stripped = 0
+        collapsed = 0
+        for i, document in enumerate(corpus):
+            title, props_text, content = split_document(document)
+            kept_lines, seen = [], set()
+            for line in content.split("\n"):
+                key = line_key(line)
+                if key is not None and (key in boilerplate or key in seen):
+                    lines_stripped += 1
+                    continue
+                seen.add(key)
+                kept_lines.append(line)
+            content = "\n".join(kept_lines)
+
+            signature = self.signature(content)
+            duplicate_of = None
+            if signature is not None:
+                bands = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                         for band in range(self.bands)]
+                candidates = {j for band in bands for j in buckets.get(band, ())}
+                for j in sorted(candidates):
+                    if np.mean(signatures[j] == signature) >= self.similarity:
+                        duplicate_of = j
+                        break
+                if duplicate_of is None:
+                    signatures[i] = signature
+                    for band in bands:
+                        buckets.setdefault(band, []).append(i)
+
+            if duplicate_of is not None:
+                collapsed += 1
+                content = f"(Near-duplicate of the page '{corpus.titles[duplicate_of]}': content omitted)"
+            result.add(title, props_text, content, page_id=corpus.page_ids[i])
+
+        report = {
+            "pages": n,
+            "boilerplate_lines": len(boilerplate),
+            "lines_stripped": lines_stripped,
+            "pages_collapsed": collapsed,
+            "chars_saved": corpus.total_chars - result.total_chars,
+            "tokens_saved": corpus.total_tokens - result.total_tokens,
+        }
+        return result, report
+
+
+def dedup_corpus(corpus, estimator=None, similarity=0.9, boilerplate_share=0.5):
+    """
+    Runs the Deduplicator, logs and records what it saved, and returns the new corpus
+    (the original one is closed).
+    """
+    logger = logging.getLogger(__name__)
+    deduped, report = Deduplicator(similarity=similarity, boilerplate_share=boilerplate_share).run(corpus, estimator)
+    corpus.close()
+    for name in ("lines_stripped", "pages_collapsed", "chars_saved", "tokens_saved"):
+        metrics.count(f"dedup.{name}", report[name])
+    share = report["tokens_saved"] / (report["tokens_saved"] + deduped.total_tokens) if deduped.total_tokens else 0.0
+    logger.info(f"Dedup: {report['lines_stripped']} repeated/template lines stripped "
+                f"({report['boilerplate_lines']} template lines), {report['pages_collapsed']} near-duplicate pages "
+                f"collapsed; saved {report['chars_saved']:,} chars / ~{report['tokens_saved']:,} tokens ({share:.0%}).")
+    return deduped
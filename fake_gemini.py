@@ -0,0 +1,111 @@
+import math
+import random
+import threading
+import time
+
+from token_budget import estimate_tokens
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.cached_content_token_count = 0
+        self.thoughts_token_count = 0
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeModels:
+    """
+    Stand-in for client.models: generate_content, generate_content_stream and count_tokens.
+    Latency = latency + prompt tokens / input_tps (+ jitter); quota_rate of calls fail with a 429.
+    rpm: per-model requests per `window` seconds; calls beyond it fail with a 429 carrying a retryDelay.
+    """
+    def __init__(self, latency=0.2, jitter=0.0, input_tps=0, output_tokens=400, quota_rate=0.0, seed=0,
+                 rpm=None, window=60.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.input_tps = input_tps
+        self.output_tokens = output_tokens
+        self.quota_rate = quota_rate
+        self.rpm = rpm
+        self.window = window
+        self.windows = {} # model -> accepted call times within the window
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.latencies = []
+        self.quota_errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def reset_counts(self):
+        with self.lock:
+            self.calls = {}
+            self.latencies = []
+            self.quota_errors = 0
+            self.max_in_flight = 0
+
+    def _call(self, kind, model, contents):
+        prompt_tokens = estimate_tokens(contents)
+        with self.lock:
+            self.calls[f"{kind}[{model}]"] = self.calls.get(f"{kind}[{model}]", 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            quota = self.quota_rate and self.rng.random() < self.quota_rate
+            retry_after = None
+            if self.rpm:
+                now = time.monotonic()
+                accepted = [t for t in self.windows.get(model, []) if t > now - self.window]
+                if len(accepted) >= self.rpm:
+                    retry_after = accepted[0] + self.window - now
+                else:
+                    accepted.append(now)
+                self.windows[model] = accepted
+            jitter = self.rng.random() * self.jitter if self.jitter else 0.0
+        started = time.perf_counter()
+        try:
+            if retry_after is not None:
+                with self.lock:
+                    self.quota_errors += 1
+                raise RuntimeError(f"429 RESOURCE_EXHAUSTED: Quota exceeded for {model} (fake). "
+                                   f"Please retry in {math.ceil(retry_after * 10) / 10:.1f}s.")
+            delay = self.latency + jitter + (prompt_tokens / self.input_tps if self.input_tps else 0.0)
+            time.sleep(delay)
+            if quota:
+                with self.lock:
+                    self.quota_errors += 1
+                raise RuntimeError("429 RESOURCE_EXHAUSTED: Quota exceeded (fake)")
+            text = f"## Summary\n- {prompt_tokens} tokens read\n" + "- point " * (self.output_tokens // 2)
+            return FakeResponse(text, FakeUsage(prompt_tokens, self.output_tokens))
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.latencies.append(time.perf_counter() - started)
+
+    def generate_content(self, model, contents, **kwargs):
+        return self._call("generate", model, contents)
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        response = self._call("stream", model, contents)
+        lines = response.text.splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            # Usage is complete on the last chunk, like the real stream
+            yield FakeResponse(line, response.usage_metadata if i == len(lines) - 1 else None)
+
+    def count_tokens(self, model, contents, **kwargs):
+        return type("CountTokensResponse", (), {"total_tokens": estimate_tokens(contents)})()
+
+
+class FakeGenaiClient:
+    """
+    Offline replacement for genai.Client (only .models is used by the summarizer).
+    """
+    def __init__(self, **kwargs):
+        self.models = FakeModels(**kwargs)
@@ -0,0 +1,355 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _new_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def _rich_text(text):
+    return [{"type": "text", "text": {"content": text}, "plain_text": text, "annotations": {}}]
+
+
+class FakeWorkspace:
+    """
+    Synthetic Notion workspace held in memory: pages, block trees and a database (or a root page).
+    Used by the fake server and the benchmark; the shape is deterministic for a given seed.
+    """
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.databases = {} # id -> database object
+        self.pages = {} # id -> page object
+        self.children = {} # block/page id -> [block]
+        self.rows = {} # database id -> [page id]
+        self.source_id = None
+        self.block_count = 0
+
+    def _timestamp(self, days_ago=0):
+        when = datetime(2026, 1, 1, tzinfo=timezone.utc) - timedelta(days=days_ago)
+        return when.isoformat().replace("+00:00", "Z")
+
+    def _page(self, title, parent, title_property="title", database=False):
+        page_id = _new_id(self.rng)
+        properties = {title_property: {"id": "title", "type": "title", "title": _rich_text(title)}}
+        if database:
+            properties["날짜"] = {"id": "d", "type": "date", "date": {"start": "2026-01-01"}}
+            properties["태그"] = {"id": "t", "type": "multi_select", "multi_select": [{"name": "bench"}]}
+            properties["상태"] = {"id": "s", "type": "status", "status": {"name": "Done"}}
+        page = {
+            "object": "page",
+            "id": page_id,
+            "parent": parent,
+            "archived": False,
+            "last_edited_time": self._timestamp(self.rng.randint(0, 365)),
+            "properties": properties,
+        }
+        self.pages[page_id] = page
+        self.children[page_id] = []
+        return page
+
+    def _block(self, parent_id, block_type, text, has_children=False):
+        block = {
+            "object": "block",
+            "id": _new_id(self.rng),
+            "type": block_type,
+            "has_children": has_children,
+            block_type: {"rich_text": _rich_text(text)},
+        }
+        self.children.setdefault(parent_id, []).append(block)
+        self.children.setdefault(block["id"], [])
+        self.block_count += 1
+        return block
+
+    def _fill(self, parent_id, depth, fanout, paragraphs, words):
+        """
+        Writes `paragraphs` text blocks under parent_id, plus `fanout` toggles nesting `depth` levels down.
+        """
+        for i in range(paragraphs):
+            text = " ".join(self.rng.choice(_WORDS) for _ in range(words))
+            self._block(parent_id, self.rng.choice(_TEXT_TYPES), text)
+        if depth <= 0:
+            return
+        for i in range(fanout):
+            toggle = self._block(parent_id, "toggle", f"Section {depth}.{i}", has_children=True)
+            self._fill(toggle["id"], depth - 1, fanout, max(1, paragraphs // 2), words)
+
+    def build(self, pages=100, depth=2, fanout=3, paragraphs=8, words=40, source="database"):
+        """
+        N pages, each with a block tree of depth D and fan-out F.
+        source='database': pages are rows of one database (the benchmark source).
+        source='page': pages are child_page blocks of a root page (nested pages mode).
+        """
+        if source == "database":
+            db_id = _new_id(self.rng)
+            self.databases[db_id] = {
+                "object": "database",
+                "id": db_id,
+                "title": _rich_text("Benchmark DB"),
+                "properties": {
+                    "이름": {"id": "title", "type": "title", "title": {}},
+                    "날짜": {"id": "d", "type": "date", "date": {}},
+                    "태그": {"id": "t", "type": "multi_select", "multi_select": {"options": []}},
+                    "상태": {"id": "s", "type": "status", "status": {}},
+                },
+            }
+            self.rows[db_id] = []
+            for i in range(pages):
+                page = self._page(f"Page {i}", {"type": "database_id", "database_id": db_id}, "이름", database=True)
+                self.rows[db_id].append(page["id"])
+                self._fill(page["id"], depth, fanout, paragraphs, words)
+            self.source_id = db_id
+        else:
+            root = self._page("Benchmark Root", {"type": "workspace", "workspace": True})
+            for i in range(pages):
+                page = self._page(f"Page {i}", {"type": "page_id", "page_id": root["id"]})
+                # child_page blocks share their id (and edit time) with the page they represent
+                self.children[root["id"]].append({
+                    "object": "block", "id": page["id"], "type": "child_page",
+                    "has_children": True, "child_page": {"title": f"Page {i}"},
+                    "last_edited_time": page["last_edited_time"],
+                })
+                self.block_count += 1
+                self._fill(page["id"], depth, fanout, paragraphs, words)
+            self.source_id = root["id"]
+        return self
+
+    def create_page(self, body):
+        """
+        POST /pages: adds the page (and its children) to the workspace.
+        """
+        with self.lock:
+            parent = body.get("parent", {})
+            properties = body.get("properties", {})
+            page_id = _new_id(self.rng)
+            page = {
+                "object": "page",
+                "id": page_id,
+                "parent": parent,
+                "archived": False,
+                "last_edited_time": self._timestamp(),
+                "properties": {name: _stored_property(value) for name, value in properties.items()},
+            }
+            self.pages[page_id] = page
+            self.children[page_id] = self._stored_blocks(body.get("children", []))
+            if "database_id" in parent:
+                self.rows.setdefault(parent["database_id"], []).append(page_id)
+            elif "page_id" in parent:
+                title = "".join(t["plain_text"] for t in page["properties"].get("title", {}).get("title", []))
+                self.children.setdefault(parent["page_id"], []).append({
+                    "object": "block", "id": page_id, "type": "child_page",
+                    "has_children": True, "child_page": {"title": title},
+                    "last_edited_time": page["last_edited_time"],
+                })
+            return page
+
+    def append_children(self, parent_id, blocks):
+        """
+        PATCH /blocks/{id}/children: appends the blocks, returning them as stored.
+        """
+        with self.lock:
+            stored = self._stored_blocks(blocks)
+            self.children[parent_id].extend(stored)
+            return stored
+
+    def _stored_blocks(self, blocks):
+        # Like Notion, every written block gets an id
+        return [{**block, "object": "block", "id": _new_id(self.rng), "has_children": False} for block in blocks]
+
+    def query(self, database_id, body):
+        with self.lock:
+            ids = list(self.rows.get(database_id, []))
+        pages = [self.pages[i] for i in ids if not self.pages[i]["archived"]]
+        return [p for p in pages if _matches(p, body.get("filter"))]
+
+
+_WORDS = ("notion", "summary", "회고", "아이디어", "프로젝트", "회의", "정리", "latency", "throughput",
+          "cache", "page", "block", "오늘", "내일", "목표", "결과", "analysis", "report", "데이터", "노트")
+_TEXT_TYPES = ("paragraph", "paragraph", "paragraph", "bulleted_list_item", "heading_2", "to_do", "quote")
+
+
+def _stored_property(value):
+    """
+    Property as the API returns it: title segments get plain_text (page parents send a bare list).
+    """
+    if isinstance(value, list):
+        value = {"title": value}
+    if "title" in value:
+        segments = [dict(t, plain_text=t.get("text", {}).get("content", "")) for t in value["title"]]
+        return {"type": "title", "title": segments}
+    return dict(value, type=value.get("type") or next(iter(value), None))
+
+
+def _matches(page, query_filter):
+    """
+    Evaluates the subset of Notion filters the connector sends (title does_not_contain,
+    last_edited_time on_or_after, 'and').
+    """
+    if not query_filter:
+        return True
+    if "and" in query_filter:
+        return all(_matches(page, f) for f in query_filter["and"])
+    if "or" in query_filter:
+        return any(_matches(page, f) for f in query_filter["or"])
+    if query_filter.get("timestamp") == "last_edited_time":
+        condition = query_filter["last_edited_time"]
+        if "on_or_after" in condition:
+            return page["last_edited_time"] >= condition["on_or_after"][:19]
+        return True
+    if "title" in query_filter:
+        prop = page["properties"].get(query_filter.get("property"), {})
+        title = "".join(t.get("plain_text", "") for t in prop.get("title", []))
+        condition = query_filter["title"]
+        if "does_not_contain" in condition:
+            return condition["does_not_contain"] not in title
+        if "contains" in condition:
+            return condition["contains"] in title
+    return True
+
+
+def _paginate(items, cursor, page_size):
+    start = int(cursor or 0)
+    page_size = max(1, min(int(page_size or 100), 100))
+    end = start + page_size
+    return {
+        "object": "list",
+        "results": items[start:end],
+        "has_more": end < len(items),
+        "next_cursor": str(end) if end < len(items) else None,
+    }
+
+
+class FakeNotionServer:
+    """
+    Local stand-in for the Notion endpoints the connector uses:
+    GET /databases/{id}, POST /databases/{id}/query, GET/PATCH /pages/{id}, POST /pages,
+    GET/PATCH /blocks/{id}/children, with cursor pagination.
+    latency: seconds added to every response (plus up to `jitter` seconds).
+    throttle_rate: fraction of requests answered with 429 + Retry-After (retry_after seconds).
+    Counts calls per endpoint (ids collapsed) so benchmarks can report API usage.
+    """
+    def __init__(self, workspace, latency=0.0, jitter=0.0, throttle_rate=0.0, retry_after=0.1, seed=0):
+        self.workspace = workspace
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.throttled = 0
+        self.logger = logging.getLogger(__name__)
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real API
+            # Headers and body are separate writes; without this, Nagle + delayed ACK add ~40 ms per response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                status, payload, headers = server.handle(self.command, self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = _handle
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-notion", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counts(self):
+        with self.lock:
+            self.calls = {}
+            self.throttled = 0
+
+    def handle(self, method, raw_path, body):
+        """
+        Routes one request. Returns (status, payload, headers).
+        """
+        parsed = urlparse(raw_path)
+        path = parsed.path[len("/v1"):] if parsed.path.startswith("/v1") else parsed.path
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        endpoint = f"{method} {re.sub(r'/(blocks|pages|databases)/[^/]+', lambda m: f'/{m.group(1)}/{{id}}', path)}"
+
+        delay = self.latency + (self.rng.random() * self.jitter if self.jitter else 0.0)
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            throttle = self.throttle_rate and self.rng.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+        if delay:
+            time.sleep(delay)
+        if throttle:
+            return 429, {"object": "error", "status": 429, "code": "rate_limited", "message": "Rate limited"}, \
+                {"Retry-After": str(self.retry_after)}
+
+        ws = self.workspace
+        parts = path.strip("/").split("/")
+        if len(parts) > 1 and re.fullmatch(r"[0-9a-fA-F]{32}", parts[1]):
+            # Like Notion, accept IDs without dashes (as copied from a URL)
+            parts[1] = str(uuid.UUID(parts[1]))
+        try:
+            if parts[0] == "databases" and len(parts) == 2 and method == "GET":
+                if parts[1] in ws.databases:
+                    return 200, ws.databases[parts[1]], {}
+            elif parts[0] == "databases" and len(parts) == 3 and parts[2] == "query" and method == "POST":
+                if parts[1] in ws.databases:
+                    return 200, _paginate(ws.query(parts[1], body), body.get("start_cursor"), body.get("page_size")), {}
+            elif parts[0] == "pages" and len(parts) == 1 and method == "POST":
+                return 200, ws.create_page(body), {}
+            elif parts[0] == "pages" and len(parts) == 2:
+                page = ws.pages.get(parts[1])
+                if page:
+                    if method == "PATCH":
+                        page["archived"] = bool(body.get("archived", page["archived"]))
+                    return 200, page, {}
+            elif parts[0] == "blocks" and len(parts) == 3 and parts[2] == "children":
+                if parts[1] in ws.children:
+                    if method == "PATCH":
+                        return 200, {"object": "list", "results": ws.append_children(parts[1], body.get("children", []))}, {}
+                    return 200, _paginate(ws.children[parts[1]], params.get("start_cursor"), params.get("page_size")), {}
+        except (KeyError, ValueError) as e:
+            return 400, {"object": "error", "status": 400, "code": "validation_error", "message": str(e)}, {}
+        return 404, {"object": "error", "status": 404, "code": "object_not_found", "message": f"{method} {path}"}, {}
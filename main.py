@@ -1,10 +1,20 @@
+import argparse
 import logging
 import sys
 import time
 
 from dotenv import load_dotenv
-from notion_connector import NotionConnector
-from summarizer import GeminiSummarizer
+from cache import PageCache, ResponseCache, SourceMetadataCache
+from corpus import CorpusBuilder
+from dedup import dedup_corpus
+from metrics import metrics, profiling
+from notion_connector import NotionAPIError, NotionConnector, SummaryPageStream
+from per_page import PerPageRunner
+from quota import parse_limits
+from relevance import filter_corpus
+from snapshot import SnapshotConnector, SnapshotWriter
+from pipeline import ReportPipeline
+from summarizer import GeminiSummarizer, SummarizationError
 
 # Configure logging
 logging.basicConfig(
@@ -30,138 +40,380 @@ def print_banner():
     """)
     print("="*45 + "\n")
 
-def main():
-    load_dotenv()
-    
-    print_banner()
+def build_parser():
+    parser = argparse.ArgumentParser(description="Notion AI Assistant")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore the local page cache and re-download every page")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Don't read or write the local page/response caches")
+    parser.add_argument("--chunk-tokens", type=int, default=100_000,
+                        help="Token budget per Gemini request; larger input is summarized in chunks (map-reduce)")
+    parser.add_argument("--parallel", type=int, default=4,
+                        help="Number of chunk summaries requested concurrently")
+    parser.add_argument("--fan-in", type=int, default=8,
+                        help="Number of partial summaries merged per reduce request")
+    parser.add_argument("--token-budget", type=int, default=None,
+                        help="Hard limit on input tokens; whole pages beyond it are skipped (never cut mid-page)")
+    parser.add_argument("--calibrate-tokens", action="store_true",
+                        help="Calibrate the local token estimate with Gemini's count_tokens before planning")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the token/cost plan and exit without calling Gemini")
+    parser.add_argument("--stream", action="store_true",
+                        help="Print the report as it is generated and write it to Notion progressively")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap fetching, extraction and chunk summarization (no pre-run plan/streaming)")
+    parser.add_argument("--queue-size", type=int, default=32,
+                        help="Pages/documents buffered between --pipeline stages (backpressure threshold)")
+    parser.add_argument("--per-page", action="store_true",
+                        help="Write one summary page per source page instead of one report (unchanged pages are skipped)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Number of pages summarized concurrently in --per-page mode")
+    parser.add_argument("--metrics", metavar="PATH", default=None,
+                        help="Write a JSON run report (stage/endpoint timings, bytes, retries, Gemini tokens)")
+    parser.add_argument("--prometheus", metavar="PATH", default=None,
+                        help="Also write the run metrics as a Prometheus textfile")
+    parser.add_argument("--profile", metavar="PATH", default=None,
+                        help="Profile the run with cProfile and dump the stats to PATH")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Trace allocations with tracemalloc and log the peak and top allocation sites")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Strip template lines repeated across pages and collapse near-duplicate pages before summarizing")
+    parser.add_argument("--dedup-similarity", type=float, default=0.9,
+                        help="Estimated Jaccard similarity (0-1) from which --dedup treats two pages as duplicates")
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="Only send the K pages most relevant to the instruction (local BM25 ranking)")
+    parser.add_argument("--min-relevance", type=float, default=None,
+                        help="Only send pages scoring at least this fraction (0-1) of the best page's relevance")
+    parser.add_argument("--save-snapshot", metavar="PATH", default=None,
+                        help="Also save every page read (properties + text) to a snapshot file for --replay")
+    parser.add_argument("--replay", metavar="PATH", default=None,
+                        help="Read pages from a snapshot instead of Notion (no Notion requests, reports saved locally)")
+    parser.add_argument("--replay-output", metavar="DIR", default="reports",
+                        help="Folder for the markdown reports written in --replay mode")
+    parser.add_argument("--max-depth", type=int, default=None,
+                        help="Maximum block nesting depth to read (default: no limit)")
+    parser.add_argument("--max-nodes", type=int, default=None,
+                        help="Maximum block listings per page / nested-page scan (default: no limit)")
+    parser.add_argument("--max-concurrency", type=int, default=8,
+                        help="Notion block listings in flight at once (pages per extraction batch)")
+    parser.add_argument("--model-limits", metavar="SPEC", default=None,
+                        help="Gemini quotas per model and API key, e.g. 'gemini-3-flash-preview=10/250000,gemini-2.5-flash=10' "
+                             "(RPM[/TPM]); requests are routed to a model with quota left")
+    parser.add_argument("--hedge-after", type=float, default=None,
+                        help="Seconds before a slow Gemini request is also sent to another model/key "
+                             "(for a typical prompt, longer for larger ones; default: adapts to observed "
+                             "latency; 0 disables)")
+    return parser
 
-    # 1. Get User Input
-    user_instruction = input("Q. 이 페이지/데이터베이스를 어떻게 요약/분석 해드릴까요?\n   (예: '회고록 써줘', '아이디어만 뽑아서 정리해줘')\n>> ")
-    
-    if not user_instruction.strip():
-        print("입력이 없어 종료합니다.")
-        return
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
 
-    report_title = input("\nQ. 생성될 페이지의 제목을 무엇으로 할까요?\n   (엔터치면 'AI Report'로 저장)\n>> ")
-    if not report_title.strip():
-        report_title = "AI Report"
+def export_metrics(args):
+    """
+    Logs the run metrics and writes the JSON / Prometheus reports if requested.
+    """
+    logger.info(metrics.summary())
+    if args.metrics:
+        metrics.write_json(args.metrics)
+        logger.info(f"Run report written to {args.metrics}")
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
 
-    logger.info("Starting process...")
-    
+def stream_report(notion, summarizer, documents, user_instruction, report_title, result):
+    """
+    Streaming mode: prints the report as Gemini generates it and appends completed
+    lines to the Notion page in batches while generation is still running.
+    """
+    logger.info(f"Creating report page '{report_title}' in Notion...")
+    new_page = notion.create_summary_page("Aggregate", report_title, "")
+    if not new_page:
+        logger.error("Failed to create report page.")
+        result["error"] = "Failed to create report page"
+        return result
+    result["report_page_id"] = new_page["id"]
+
+    writer = SummaryPageStream(notion, new_page["id"])
+    logger.info("Streaming analysis from Gemini...")
+    print("\n" + "-"*30)
     try:
-        # Initialize connectors
-        notion = NotionConnector()
-        summarizer = GeminiSummarizer()
-        
-        # 2. Fetch Data (All pages, excluding existing summaries)
-        logger.info("Fetching pages from Notion...")
-        pages = notion.fetch_unsummarized_pages()
-        logger.info(f"Found {len(pages)} pages in the database.")
-
-        if not pages:
-            logger.info("No pages found to process.")
+        try:
+            with metrics.stage("summarize_stream"):
+                for piece in summarizer.summarize_documents_stream(documents, user_instruction=user_instruction):
+                    print(piece, end="", flush=True)
+                    writer.write(piece)
+        except SummarizationError as e:
+            logger.error(f"Failed to generate summary: {e}")
+            result["error"] = str(e)
+        finally:
+            print("\n" + "-"*30 + "\n")
+            with metrics.stage("upload"):
+                uploaded = writer.close()
+
+        if summarizer.cache:
+            logger.info(f"Gemini response cache: {summarizer.cache.stats()}")
+        if not uploaded:
+            logger.error("Report page was created but some blocks could not be written.")
+            result["error"] = result["error"] or "Some blocks could not be written"
+        elif not result["error"]:
+            logger.info(f"Successfully wrote {writer.blocks_written} blocks to the report page in Notion! 🎉")
+            result["status"] = "ok"
+    finally:
+        if result["status"] != "ok":
+            # The page was created before any text existed: don't leave an empty/partial report behind
+            _discard_report_page(notion, new_page["id"])
+            result["report_page_id"] = None
+    return result
+
+def _discard_report_page(notion, page_id):
+    try:
+        if notion.archive_page(page_id):
+            logger.info("Archived the incomplete report page.")
             return
+    except Exception as e:
+        logger.warning(f"Could not archive page {page_id}: {e}")
+    logger.error(f"Incomplete report page {page_id} is left in Notion; delete it by hand.")
 
-        # 3. Aggregate Text
-        logger.info("Extracting text from pages...")
-        aggregated_text = ""
-        
-        for i, page in enumerate(pages):
-            # Rate limiting check (not strictly needed for reading if sequential, but good practice)
-            # Fetching content
-            page_id = page['id']
-            
-            # Helper to get title for logging
-            title = "Untitled"
-            props = page.get("properties", {})
-            for prop_val in props.values():
-                if prop_val["type"] == "title":
-                    title_list = prop_val.get("title", [])
-                    if title_list:
-                        title = title_list[0].get("plain_text", "")
-                    break
-            
-            # Extract useful properties (Status, Tags, Date, URL, etc.)
-            props_text = ""
-            for prop_name, prop_val in props.items():
-                p_type = prop_val["type"]
-                p_content = ""
-                
-                if p_type == "select":
-                    val = prop_val.get("select")
-                    if val: p_content = val.get("name", "")
-                elif p_type == "multi_select":
-                    vals = prop_val.get("multi_select", [])
-                    p_content = ", ".join([v.get("name", "") for v in vals])
-                elif p_type == "status":
-                    val = prop_val.get("status")
-                    if val: p_content = val.get("name", "")
-                elif p_type == "date":
-                    val = prop_val.get("date")
-                    if val: 
-                        start = val.get("start", "")
-                        end = val.get("end", "")
-                        p_content = f"{start} ~ {end}" if end else start
-                elif p_type == "url":
-                    p_content = prop_val.get("url", "")
-                elif p_type == "email":
-                    p_content = prop_val.get("email", "")
-                elif p_type == "checkbox":
-                    p_content = "Yes" if prop_val.get("checkbox") else "No"
-                
-                if p_content:
-                    props_text += f"- {prop_name}: {p_content}\n"
-            
-            logger.info(f"[{i+1}/{len(pages)}] Reading: {title}")
-            
-            page_content = notion.get_page_text_content(page_id)
-            
-            # Combine Title + Properties + Content
-            aggregated_text += f"\n\n==================================================\n"
-            aggregated_text += f"PAGE TITLE: {title}\n"
-            aggregated_text += f"--------------------------------------------------\n"
-            aggregated_text += f"[Page Properties]\n{props_text}\n"
-            aggregated_text += f"--------------------------------------------------\n"
-            aggregated_text += f"[Page Content]\n{page_content}\n"
-            aggregated_text += f"==================================================\n"
-
-        logger.info(f"Total aggregated text length: {len(aggregated_text)} characters.")
-        
-        if len(aggregated_text) < 10:
+def create_summarizer(args, client=None):
+    summarizer = GeminiSummarizer(
+        chunk_tokens=args.chunk_tokens,
+        max_workers=args.parallel,
+        reduce_fan_in=args.fan_in,
+        client=client,
+        model_limits=parse_limits(args.model_limits),
+        hedge_after=args.hedge_after
+    )
+    if not args.no_cache:
+        # Identical Gemini requests (same model, prompt, instruction and input) are answered locally
+        summarizer.cache = ResponseCache()
+    return summarizer
+
+def create_metadata_cache(args):
+    """
+    Source type/schema cache for NotionConnector (None with --no-cache; --refresh re-detects).
+    """
+    if args.no_cache:
+        return None
+    return SourceMetadataCache(refresh=args.refresh)
+
+def connector_options(args, metadata_cache=None):
+    """
+    NotionConnector keyword arguments shared by every entry point (caches, traversal limits, concurrency).
+    """
+    return {
+        "metadata_cache": metadata_cache if metadata_cache is not None else create_metadata_cache(args),
+        "max_depth": args.max_depth,
+        "max_nodes": args.max_nodes,
+        "max_concurrency": args.max_concurrency,
+    }
+
+def create_connector(args):
+    """
+    Live NotionConnector (recording to --save-snapshot if given), or the offline
+    SnapshotConnector with --replay.
+    """
+    if args.replay:
+        # Pages and text come from the snapshot; reports are written to --replay-output
+        return SnapshotConnector(args.replay, output_dir=args.replay_output)
+    # Warm starts skip source detection (type + schema come from the local cache)
+    notion = NotionConnector(**connector_options(args))
+    if args.save_snapshot and notion.source_type != "unknown":
+        notion.snapshot = SnapshotWriter(args.save_snapshot, notion.source_id, notion.source_type,
+                                         getattr(notion, "database_schema", None))
+    return notion
+
+def run_report(notion, summarizer, user_instruction, report_title, args):
+    """
+    Runs one report end to end: fetch -> extract -> plan -> summarize -> save.
+    Returns a result dict with 'status' ('ok', 'empty', 'planned' or 'failed'),
+    'pages', 'report_page_id' and 'error'.
+    """
+    result = {"status": "failed", "pages": 0, "report_page_id": None, "error": None}
+    if not args.no_cache and notion.cache is None and not args.replay:
+        # Unchanged pages (same last_edited_time) are served from the local cache
+        notion.cache = PageCache(notion.source_id, refresh=args.refresh)
+
+    if args.per_page:
+        if args.dedup or args.top_k is not None or args.min_relevance is not None:
+            logger.warning("Dedup and the relevance filter work on the combined report; they are not applied with --per-page.")
+        # One summary per page; pages whose content hasn't changed since their last summary are skipped
+        runner = PerPageRunner(notion, summarizer, concurrency=args.concurrency)
+        try:
+            return runner.run(user_instruction)
+        finally:
+            runner.close()
+
+    if args.pipeline:
+        if args.dedup or args.top_k is not None or args.min_relevance is not None:
+            logger.warning("Dedup and the relevance filter need every page first; they are not applied with --pipeline.")
+        # Stages overlap: chunk summaries start while pages are still being read
+        pipeline = ReportPipeline(notion, summarizer, queue_size=args.queue_size, token_budget=args.token_budget)
+        return pipeline.run(user_instruction, report_title)
+
+    # 2. Fetch Data (All pages, excluding existing summaries)
+    # Pages are streamed batch by batch, so extraction starts while later batches are still loading.
+    logger.info("Fetching pages from Notion...")
+    pages = notion.iter_unsummarized_pages()
+
+    # 3. Aggregate Text
+    logger.info("Extracting text from pages...")
+    # Pages are appended to a bounded-memory corpus (spills to a temp file when large)
+    corpus = CorpusBuilder(estimator=summarizer.estimator)
+    try:
+        page_count = 0
+        seen_page_ids = []
+    
+        # Block trees of several pages are fetched concurrently, results keep page order
+        # (listing and extraction are interleaved, so they are timed as one stage)
+        with metrics.stage("fetch_extract"):
+            try:
+                for i, (page, page_content) in enumerate(notion.iter_page_text_contents(pages)):
+                    page_count += 1
+                    seen_page_ids.append(page["id"])
+
+                    # Title for logging + useful properties (Status, Tags, Date, URL, etc.)
+                    title, props_text = notion.extract_page_properties(page)
+
+                    logger.info(f"[{i+1}] Reading: {title}")
+
+                    # Combine Title + Properties + Content (one document per page, so chunks split on page boundaries)
+                    corpus.add(title, props_text, page_content, page_id=page["id"])
+            except NotionAPIError as e:
+                # An incomplete listing is a failed run, not an empty or partial report
+                logger.error(f"Failed to list pages: {e}")
+                result["pages"] = page_count
+                result["error"] = str(e)
+                return result
+
+        logger.info(f"Found {page_count} pages in the database.")
+        result["pages"] = page_count
+        if notion.cache:
+            logger.info(f"Page cache: {notion.cache.hits} hits, {notion.cache.misses} re-fetched.")
+            if notion.listing_complete:
+                # The listing above is complete, so anything else in the cache was deleted in Notion
+                notion.cache.evict_missing(seen_page_ids)
+        if page_count == 0:
+            logger.info("No pages found to process.")
+            result["status"] = "empty"
+            return result
+
+        if args.dedup:
+            # Template boilerplate and near-duplicate pages are removed before anything is counted or sent
+            with metrics.stage("dedup"):
+                corpus = dedup_corpus(corpus, estimator=summarizer.estimator, similarity=args.dedup_similarity)
+
+        if args.top_k is not None or args.min_relevance is not None:
+            # Only pages relevant to the instruction go to Gemini (local BM25 ranking)
+            with metrics.stage("relevance"):
+                corpus = filter_corpus(corpus, notion.source_id, user_instruction, top_k=args.top_k,
+                                       threshold=args.min_relevance, persist=not args.no_cache)
+            result["pages"] = len(corpus)
+
+        logger.info(f"Total aggregated text length: {corpus.total_chars} characters (~{corpus.total_tokens:,} tokens).")
+    
+        if corpus.total_chars < 10:
             logger.warning("Text content is too short to summarize.")
-            return
+            result["status"] = "empty"
+            return result
+
+        # 4. Token plan (per-page/total tokens, requests, projected cost) before anything is sent
+        with metrics.stage("plan"):
+            if args.calibrate_tokens:
+                summarizer.calibrate_estimator(corpus)
+            page_tokens = None if args.calibrate_tokens else corpus.page_tokens()
+            plan = summarizer.plan(corpus, titles=corpus.titles, max_tokens=args.token_budget, page_tokens=page_tokens)
+        logger.info(plan.report(top=len(corpus) if args.dry_run else 10))
+        if args.dry_run:
+            result["status"] = "planned"
+            return result
+        # Documents are read back lazily from the corpus
+        documents = corpus.iter_records(plan.kept) if plan.dropped else corpus
+
+        if args.stream:
+            return stream_report(notion, summarizer, documents, user_instruction, report_title, result)
 
-        # 4. Summarize (One-shot)
+        # 5. Summarize (one-shot if it fits in one request, map-reduce otherwise)
         logger.info("Sending data to Gemini for analysis...")
-        summary = summarizer.summarize(aggregated_text, user_instruction=user_instruction)
-        
+        with metrics.stage("summarize"):
+            summary = summarizer.summarize_documents(documents, user_instruction=user_instruction)
+    
+        if summarizer.cache:
+            logger.info(f"Gemini response cache: {summarizer.cache.stats()}")
+
         if not summary or summary.startswith("Failed to generate"):
             logger.error("Failed to generate summary.")
-            return
+            result["error"] = summary or "Empty summary"
+            return result
 
         print("\n" + "-"*30)
         print("Generated Summary Preview (First 200 chars):")
         print(summary[:200])
         print("-"*30 + "\n")
-        
-        # 5. Save Report
+    
+        # 6. Save Report
         logger.info(f"Saving report to Notion as '{report_title}'...")
         # Since we aggregate, we don't have a single 'original_page_id', using the first one or None logic?
         # The connector expects an original_page_id for the callout. 
         # Let's modify the connector call or just pass the first one for reference, 
         # OR better, pass None and handle it in connector (need to check connector code).
         # We will point to the database itself conceptually.
-        
+    
         # Creating a new page at the database level (as a row)
-        new_page = notion.create_summary_page("Aggregate", report_title, summary)
-        
+        with metrics.stage("upload"):
+            new_page = notion.create_summary_page("Aggregate", report_title, summary)
+    
         if new_page:
             logger.info("Successfully created report page in Notion! 🎉")
+            result["status"] = "ok"
+            result["report_page_id"] = new_page.get("id")
         else:
             logger.error("Failed to create report page.")
+            result["error"] = "Failed to create report page"
+        return result
+    finally:
+        # Drops the spill file (also of a filtered/deduplicated corpus, which owns the original)
+        corpus.close()
+
+def main():
+    args = parse_args()
+    load_dotenv()
+    
+    print_banner()
+
+    # 1. Get User Input
+    user_instruction = input("Q. 이 페이지/데이터베이스를 어떻게 요약/분석 해드릴까요?\n   (예: '회고록 써줘', '아이디어만 뽑아서 정리해줘')\n>> ")
+    
+    if not user_instruction.strip():
+        print("입력이 없어 종료합니다.")
+        return
+
+    # In per-page mode each summary is titled after its source page
+    report_title = "" if args.per_page else input("\nQ. 생성될 페이지의 제목을 무엇으로 할까요?\n   (엔터치면 'AI Report'로 저장)\n>> ")
+    if not report_title.strip():
+        report_title = "AI Report"
+
+    logger.info("Starting process...")
+    
+    try:
+        # Initialize connectors
+        with profiling(args.profile, trace_memory=args.trace_memory):
+            notion = create_connector(args)
+            summarizer = create_summarizer(args)
+            try:
+                result = run_report(notion, summarizer, user_instruction, report_title, args)
+                if getattr(notion, "snapshot", None) and result["status"] != "failed":
+                    # A failed run may have stopped reading early: only a finished one is committed
+                    notion.snapshot.close()
+            finally:
+                if getattr(notion, "snapshot", None):
+                    # No-op after close(); drops the partial file if the run failed
+                    notion.snapshot.abort()
+                notion.close()
+                summarizer.close()
                 
     except Exception as e:
         logger.error(f"Critical error: {e}")
+    finally:
+        export_metrics(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,231 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Object ids in URLs are collapsed so endpoints aggregate, e.g. GET /blocks/{id}/children
+_ID_RE = re.compile(r"/(blocks|pages|databases|data_sources|users|comments)/[^/]+")
+_PATH_RE = re.compile(r"^https?://[^/]+(?:/v1)?")
+
+# Gemini usage_metadata fields that are summed per model
+USAGE_FIELDS = ("prompt_token_count", "candidates_token_count", "cached_content_token_count",
+                "thoughts_token_count", "total_token_count")
+
+
+def endpoint_name(method, url):
+    """
+    'GET https://api.notion.com/v1/blocks/<id>/children?x' -> 'GET /blocks/{id}/children'
+    """
+    path = _PATH_RE.sub("", url.split("?", 1)[0])
+    path = _ID_RE.sub(lambda m: f"/{m.group(1)}/{{id}}", path)
+    return f"{method.upper()} {path}"
+
+
+class _Timing:
+    """
+    Count / total / max wall time of one stage or endpoint.
+    """
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self):
+        return {"count": self.count, "seconds": round(self.total, 4), "max_seconds": round(self.max, 4)}
+
+
+class Metrics:
+    """
+    Thread-safe run metrics: wall time and count per stage and per HTTP endpoint,
+    bytes transferred, retries/429s and Gemini token usage.
+    Exported as a JSON run report and optionally as a Prometheus textfile.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = {}
+            self.endpoints = {}
+            self.status_codes = {} # endpoint -> {status: count}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.counters = {}
+            self.usage = {} # model -> {usage field: tokens}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a block of work: `with metrics.stage("extract"): ...`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.stages.setdefault(name, _Timing()).add(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_request(self, method, url, seconds, status=None, sent=0, received=0):
+        """
+        One HTTP attempt (retries are recorded separately, each with its own status).
+        """
+        endpoint = endpoint_name(method, url)
+        with self.lock:
+            self.endpoints.setdefault(endpoint, _Timing()).add(seconds)
+            codes = self.status_codes.setdefault(endpoint, {})
+            key = str(status) if status is not None else "error"
+            codes[key] = codes.get(key, 0) + 1
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def record_usage(self, model, usage_metadata):
+        """
+        Adds a Gemini response's usage_metadata (missing fields count as 0).
+        """
+        if usage_metadata is None:
+            return
+        with self.lock:
+            totals = self.usage.setdefault(model, {field: 0 for field in USAGE_FIELDS})
+            totals["requests"] = totals.get("requests", 0) + 1
+            for field in USAGE_FIELDS:
+                totals[field] += getattr(usage_metadata, field, None) or 0
+
+    def report(self):
+        """
+        The run report as a JSON-serializable dict.
+        """
+        with self.lock:
+            return {
+                "started_at": self.started,
+                "wall_seconds": round(time.time() - self.started, 4),
+                "stages": {name: t.to_dict() for name, t in sorted(self.stages.items())},
+                "http": {
+                    "endpoints": {
+                        name: dict(t.to_dict(), status=dict(self.status_codes.get(name, {})))
+                        for name, t in sorted(self.endpoints.items())
+                    },
+                    "bytes_sent": self.bytes_sent,
+                    "bytes_received": self.bytes_received,
+                },
+                "counters": dict(sorted(self.counters.items())),
+                "gemini_usage": {model: dict(totals) for model, totals in self.usage.items()},
+            }
+
+    def summary(self):
+        """
+        One-line summary for the log.
+        """
+        report = self.report()
+        requests = sum(e["count"] for e in report["http"]["endpoints"].values())
+        tokens = sum(u.get("total_token_count", 0) for u in report["gemini_usage"].values())
+        stages = ", ".join(f"{name} {s['seconds']:.1f}s" for name, s in report["stages"].items())
+        return (f"Run metrics: {report['wall_seconds']:.1f}s wall, {requests} Notion requests "
+                f"({report['http']['bytes_received'] / 1024:.0f} KB received), "
+                f"{report['counters'].get('notion.retries', 0)} retries, "
+                f"{report['counters'].get('notion.429', 0)} x 429, {tokens:,} Gemini tokens. Stages: {stages}")
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+    def write_prometheus(self, path):
+        """
+        Writes the metrics in the Prometheus text format (for node_exporter's textfile collector).
+        The file is replaced atomically so a scrape never sees a partial file.
+        """
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        metric("notion_summarizer_run_seconds", "gauge", "Wall time of the last run.",
+               [({}, report["wall_seconds"])])
+        metric("notion_summarizer_stage_seconds_total", "counter", "Wall time spent per stage.",
+               [({"stage": n}, s["seconds"]) for n, s in report["stages"].items()])
+        metric("notion_summarizer_stage_calls_total", "counter", "Number of times each stage ran.",
+               [({"stage": n}, s["count"]) for n, s in report["stages"].items()])
+        metric("notion_summarizer_http_seconds_total", "counter", "Notion API time per endpoint.",
+               [({"endpoint": n}, e["seconds"]) for n, e in report["http"]["endpoints"].items()])
+        metric("notion_summarizer_http_requests_total", "counter", "Notion API requests per endpoint and status.",
+               [({"endpoint": n, "status": code}, count)
+                for n, e in report["http"]["endpoints"].items() for code, count in e["status"].items()])
+        metric("notion_summarizer_http_bytes_total", "counter", "Bytes transferred to/from Notion.",
+               [({"direction": "sent"}, report["http"]["bytes_sent"]),
+                ({"direction": "received"}, report["http"]["bytes_received"])])
+        metric("notion_summarizer_events_total", "counter", "Retries, 429s, cache hits and other events.",
+               [({"event": n}, v) for n, v in report["counters"].items()])
+        metric("notion_summarizer_gemini_tokens_total", "counter", "Gemini usage_metadata token counts.",
+               [({"model": model, "kind": field}, totals.get(field, 0))
+                for model, totals in report["gemini_usage"].items() for field in USAGE_FIELDS])
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry shared by the connector, the summarizer and the runners
+metrics = Metrics()
+
+
+@contextmanager
+def profiling(cprofile_path=None, trace_memory=False, top=15):
+    """
+    Opt-in deep dive: cProfile (stats dumped to cprofile_path, top functions logged)
+    and/or tracemalloc (peak memory and top allocation sites logged).
+    """
+    logger = logging.getLogger(__name__)
+    profiler = cProfile.Profile() if cprofile_path else None
+    if trace_memory:
+        tracemalloc.start(10)
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+            logger.info(f"cProfile stats written to {cprofile_path}\n{out.getvalue()}")
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = [f"tracemalloc: peak {peak / (1024 * 1024):.1f} MB, top allocations:"]
+            for stat in snapshot.statistics("lineno")[:top]:
+                lines.append(f"   {stat}")
+            logger.info("\n".join(lines))
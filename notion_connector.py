@@ -1,13 +1,84 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
 import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import metrics
+from rate_limiter import shared_bucket, backoff_delay, parse_retry_after
+from renderers import PropertyExtractor, render_block
+
+# Status codes worth retrying: rate limited, or a transient server-side failure
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Notion request limits: children per request, rich_text segments per block, characters per segment
+MAX_BLOCKS_PER_REQUEST = 100
+MAX_RICH_TEXT_SEGMENTS = 100
+MAX_TEXT_LENGTH = 2000
+
+# (connect, read) timeouts in seconds, so a hung request can't stall the whole run
+DEFAULT_TIMEOUT = (5, 60)
+
+class NotionAPIError(Exception):
+    """
+    Raised when the Notion API still returns an error after retries.
+    """
+    pass
+
+def parse_time(value):
+    """
+    Accepts a datetime or an ISO 8601 string (Notion uses a trailing 'Z') and returns an aware
+    datetime (naive ones are taken as UTC; None stays None).
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def normalize_id(object_id):
+    """
+    Notion IDs arrive both dashed (API responses) and undashed (URLs, .env): compare them in one form.
+    """
+    return object_id.replace("-", "").lower() if object_id else object_id
+
+def create_session(pool_size=10):
+    """
+    Creates a keep-alive requests.Session with a connection pool of the given size.
+    urllib3-level retries are disabled; NotionConnector._request does its own.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 class NotionConnector:
-    def __init__(self):
+    def __init__(self, page_size=100, max_concurrency=8, rate_limiter=None, max_retries=5,
+                 session=None, pool_size=None, timeout=DEFAULT_TIMEOUT, base_url=None, cache=None,
+                 source_id=None, metadata_cache=None, max_depth=None, max_nodes=None):
+        """
+        source_id: database/page ID to read, defaults to NOTION_DATABASE_ID.
+        session: optional transport, any object with request(method, url, **kwargs) returning a
+                 requests-style response (e.g. a shared requests.Session). Created if not given.
+        pool_size: connection pool size for the created session (defaults to max_concurrency).
+        base_url: API root, defaults to NOTION_BASE_URL or the public API (point it at a local stand-in for testing).
+        cache: optional PageCache; pages whose last_edited_time is unchanged are served from it.
+        metadata_cache: optional SourceMetadataCache; a fresh entry replaces the detection requests.
+        max_depth / max_nodes: optional limits on block nesting depth and on block listings per page
+                 (or per nested-page scan). None means complete traversal.
+        """
         self.token = os.environ["NOTION_TOKEN"]
         
         # Clean up Source ID (Handle cases like 'Page-Title-32charID')
-        raw_id = os.environ["NOTION_DATABASE_ID"]
+        raw_id = source_id or os.environ["NOTION_DATABASE_ID"]
         # If ID is part of a URL or has name prefix with hyphen, usually the ID is the last 32 chars
         # Notion IDs are 32 hex chars (sometimes with dashes).
         # Heuristic: split by '-' and check if the last part is 32 chars hex, usually it works.
@@ -24,303 +95,855 @@ class NotionConnector:
             "Content-Type": "application/json",
             "Notion-Version": "2022-06-28"
         }
-        self.base_url = "https://api.notion.com/v1"
+        self.base_url = (base_url or os.environ.get("NOTION_BASE_URL") or "https://api.notion.com/v1").rstrip("/")
         self.logger = logging.getLogger(__name__)
+        # Notion caps page_size at 100 for both database queries and block children
+        self.page_size = max(1, min(int(page_size), 100))
+        # Upper bound on block requests in flight during concurrent traversal
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._executor = None
+        # Connectors sharing a token share one limiter, so parallel fetching stays under Notion's limit
+        self.rate_limiter = rate_limiter or shared_bucket(self.token)
+        self.max_retries = max_retries
+        # Pooled keep-alive connections; the pool must fit every concurrent request
+        self._owns_session = session is None
+        self.session = session or create_session(pool_size or self.max_concurrency)
+        self.timeout = timeout
+        self.cache = cache
+        # Optional SnapshotWriter: every page read is also recorded for offline replay
+        self.snapshot = None
+        self.metadata_cache = metadata_cache
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        # Memoized references, reset for every listing: synced block original -> children,
+        # link_to_page target -> title
+        self._memo_lock = threading.Lock()
+        self._synced_children = {}
+        self._link_titles = {}
+        self._prefetched = {} # page id -> (text, nested pages) read during page discovery (page mode)
+        # Set by iter_unsummarized_pages once a full (not edited_after) listing ran to the end with
+        # no failed or cut-off part; only then may pages missing from it be treated as deleted
+        # (PageCache eviction)
+        self.listing_complete = False
         
         # Detect source type and properties
         self.source_type = "unknown"
         self.title_property_name = "title" # Default for pages
+        # Property extractors compiled from database schemas (database id -> PropertyExtractor)
+        self._extractors = {}
+        self._generic_extractor = PropertyExtractor()
         self._detect_source_type()
 
-    def _detect_source_type(self):
+    def _detect_source_type(self, use_cache=True):
         """
         Determines if the provided ID is a Database or a Page.
+        A fresh metadata cache entry (type + database schema) answers without any request.
         """
+        self._schema_from_cache = False
+        if use_cache and self.metadata_cache:
+            cached = self.metadata_cache.get(self.source_id)
+            if cached:
+                self.source_type, schema = cached
+                self.logger.info(f"Source detected as: {self.source_type.upper()} (cached)")
+                if schema is not None:
+                    self._set_database_schema(self.source_id, schema)
+                    self._schema_from_cache = True
+                return
+
         # 1. Try Database
         url_db = f"{self.base_url}/databases/{self.source_id}"
-        resp_db = requests.get(url_db, headers=self.headers)
+        resp_db = self._request("get", url_db)
         if resp_db.status_code == 200:
             self.source_type = "database"
             self.logger.info("Source detected as: DATABASE")
+            # Keep the schema: title property name for server-side filters, compiled property extractor.
+            # Taken from the schema, so it works for empty databases too.
+            schema = resp_db.json().get("properties", {})
+            self._set_database_schema(self.source_id, schema)
+            if self.metadata_cache:
+                self.metadata_cache.put(self.source_id, "database", schema)
             return
             
         # 2. Try Page
         url_page = f"{self.base_url}/pages/{self.source_id}"
-        resp_page = requests.get(url_page, headers=self.headers)
+        resp_page = self._request("get", url_page)
         if resp_page.status_code == 200:
             self.source_type = "page"
             self.logger.info("Source detected as: PAGE (Nested Pages Mode)")
+            if self.metadata_cache:
+                self.metadata_cache.put(self.source_id, "page")
             return
             
         self.logger.error(f"Could not identify source ID '{self.source_id}'. Check permissions or ID validity.")
 
-    def fetch_unsummarized_pages(self):
+    def _request(self, method, url, idempotent=True, **kwargs):
+        """
+        Single entry point for every Notion API call.
+        Waits on the shared rate limiter, retries 429/5xx and connection errors with
+        exponential backoff + jitter, and honours Retry-After.
+        idempotent=False (creating a page, appending blocks): a 5xx or a timeout may come after
+        Notion applied the request, so only 429s and failed connects are retried (no duplicates).
+        Returns the final response (callers still check status_code).
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = time.perf_counter()
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
+            metrics.add_time("notion.rate_limit_wait", started - waited)
+            try:
+                kwargs.setdefault("timeout", self.timeout)
+                response = self.session.request(method, url, headers=self.headers, **kwargs)
+            except requests.exceptions.RequestException as e:
+                metrics.record_request(method, url, time.perf_counter() - started)
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, requests.exceptions.ConnectTimeout)):
+                    raise
+                metrics.count("notion.retries")
+                delay = backoff_delay(attempt)
+                self.logger.warning(f"Notion request failed ({e}), retrying in {delay:.1f}s ({attempt+1}/{self.max_retries})")
+                time.sleep(delay)
+                continue
+
+            metrics.record_request(method, url, time.perf_counter() - started, response.status_code,
+                                   sent=self._body_size(response), received=len(getattr(response, "content", b"") or b""))
+            if response.status_code == 429:
+                metrics.count("notion.429")
+            if response.status_code not in RETRYABLE_STATUS:
+                return response
+            if not idempotent and response.status_code != 429:
+                self.logger.error(f"{method.upper()} {url} failed with HTTP {response.status_code}; "
+                                  f"not retried, it may have been applied")
+                return response
+            if attempt >= self.max_retries:
+                self.logger.error(f"Giving up on {method.upper()} {url} after {attempt+1} attempts (HTTP {response.status_code})")
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code == 429 and retry_after is not None:
+                # Throttled: hold back every thread sharing the limiter, not just this one
+                self.rate_limiter.pause(retry_after)
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            metrics.count("notion.retries")
+            metrics.add_time("notion.retry_sleep", delay)
+            self.logger.warning(f"Notion API returned {response.status_code} for {method.upper()} {url}, retrying in {delay:.1f}s ({attempt+1}/{self.max_retries})")
+            time.sleep(delay)
+
+    @staticmethod
+    def _body_size(response):
+        """
+        Size of the request body that produced `response` (0 for GET or when unknown).
+        """
+        body = getattr(getattr(response, "request", None), "body", None)
+        return len(body) if body else 0
+
+    def fetch_unsummarized_pages(self, edited_after=None):
+        """
+        Returns all pages (excluding existing summaries) as a list.
+        Prefer iter_unsummarized_pages() to start processing before the last batch arrives.
+        """
+        return list(self.iter_unsummarized_pages(edited_after=edited_after))
+
+    def iter_unsummarized_pages(self, edited_after=None):
+        """
+        Yields pages (excluding existing summaries) as each batch arrives from Notion.
+        edited_after: optional datetime or ISO string; only pages edited on/after it are returned.
+        Raises NotionAPIError when the listing fails or stops early.
+        """
+        edited_after = parse_time(edited_after)
+        self._reset_memos()
+        self.listing_complete = False
         if self.source_type == "database":
-            return self._fetch_from_database()
+            yield from self._fetch_from_database(edited_after)
+            # An incremental listing leaves out unchanged pages, so it is never complete
+            self.listing_complete = edited_after is None
         elif self.source_type == "page":
-            return self._fetch_from_page()
-        return []
+            # Set by _fetch_from_page: a failed subtree may hide nested pages
+            yield from self._fetch_from_page(edited_after)
+        else:
+            raise NotionAPIError(f"Could not identify source ID '{self.source_id}'; nothing can be listed.")
+
+    def query_database(self, database_id, filter=None, sorts=None, page_size=None, strict=False):
+        """
+        Generator over every page matching a database query.
+        Follows has_more/next_cursor so databases larger than one batch are read completely.
+        strict: raise NotionAPIError on a failed request (see _paginate).
+        """
+        url = f"{self.base_url}/databases/{database_id}/query"
+        body = {"page_size": page_size or self.page_size}
+        if filter:
+            body["filter"] = filter
+        if sorts:
+            body["sorts"] = sorts
+        yield from self._paginate("post", url, body, strict=strict)
+
+    def _paginate(self, method, url, body=None, strict=False):
+        """
+        Follows Notion's cursor pagination and yields results batch by batch.
+        POST endpoints take the cursor in the JSON body, GET endpoints in the query string.
+        strict: raise NotionAPIError on a failed response instead of logging and stopping.
+        """
+        cursor = None
+        while True:
+            if method == "post":
+                payload = dict(body or {})
+                if cursor:
+                    payload["start_cursor"] = cursor
+                response = self._request("post", url, json=payload)
+            else:
+                params = {"page_size": self.page_size}
+                if cursor:
+                    params["start_cursor"] = cursor
+                response = self._request("get", url, params=params)
+
+            if response.status_code != 200:
+                if strict:
+                    raise NotionAPIError(f"HTTP {response.status_code} for {url}: {response.text}")
+                self.logger.error(f"Error fetching {url}: {response.text}")
+                return
+
+            data = response.json()
+            yield from data.get("results", [])
 
-    def _fetch_from_database(self):
+            cursor = data.get("next_cursor")
+            if not data.get("has_more") or not cursor:
+                return
+
+    def _build_query_filter(self, title_property=None, edited_after=None):
+        """
+        Builds a server-side filter that skips existing summaries and old pages.
+        Notion has no 'does not start with', so 'does_not_contain' is used for the title.
+        """
+        conditions = []
+        if title_property:
+            conditions.append({
+                "property": title_property,
+                "title": {"does_not_contain": "[AI Summary]"}
+            })
+        if edited_after:
+            conditions.append({
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": edited_after.isoformat()}
+            })
+
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"and": conditions}
+
+    def _edited_since(self, obj, edited_after):
+        """
+        Client-side counterpart of the last_edited_time filter (used where Notion can't filter).
         """
-        Fetches pages from the database using requests.
+        if not edited_after:
+            return True
+        edited = obj.get("last_edited_time")
+        return not edited or parse_time(edited) >= edited_after
+
+    @staticmethod
+    def _get_page_title(page, default="Untitled"):
+        """
+        Returns the plain text of a page's title property, whatever it is named.
+        """
+        for prop_val in page.get("properties", {}).values():
+            if prop_val.get("type") == "title":
+                title_list = prop_val.get("title", [])
+                if title_list:
+                    return title_list[0].get("plain_text", "")
+                break
+        return default
+
+    def _set_database_schema(self, database_id, schema):
+        """
+        Compiles the property extractor for a database and, for the source database,
+        records the title/date/tag property names used when creating summary pages.
+        """
+        extractor = PropertyExtractor(schema)
+        self._extractors[normalize_id(database_id)] = extractor
+        if normalize_id(database_id) != normalize_id(self.source_id):
+            return
+        self.database_schema = schema
+        if extractor.title_property:
+            self.title_property_name = extractor.title_property
+        # First date / multi_select property, re-derived whenever the schema is replaced
+        for attr, p_type in (("date_property_name", "date"), ("tag_property_name", "multi_select")):
+            name = next((n for n, prop in schema.items() if prop.get("type") == p_type), None)
+            if name:
+                setattr(self, attr, name)
+            elif hasattr(self, attr):
+                delattr(self, attr)
+
+    def extract_page_properties(self, page):
+        """
+        Returns (title, properties text) for a page.
+        Properties are rendered as '- Name: value' lines (Status, Tags, Date, Number, People, Formula, etc.)
+        by the extractor compiled from the page's database schema (per-value dispatch for other pages).
+        """
+        database_id = page.get("parent", {}).get("database_id")
+        extractor = self._extractors.get(normalize_id(database_id or self.source_id), self._generic_extractor)
+        return extractor(page)
+
+    def _fetch_from_database(self, edited_after=None):
+        """
+        Streams pages from the database, following pagination.
         Filters out pages that are already summaries (start with '[AI Summary]').
         Also detects the real name of the 'title' property.
+        Raises NotionAPIError if the query fails, also partway through pagination: an incomplete
+        listing must not look like an empty database.
         """
-        url = f"{self.base_url}/databases/{self.source_id}/query"
+        yielded = 0
         try:
-            response = requests.post(url, headers=self.headers, json={})
-            if response.status_code != 200:
-                self.logger.error(f"Error fetching database: {response.text}")
-                return []
-            
-            results = response.json().get("results", [])
-            
-            # Detect properties schema from the first result
-            if results:
-                first_props = results[0].get("properties", {})
-                for name, prop in first_props.items():
-                    if prop["type"] == "title":
-                        self.title_property_name = name
-                        self.logger.info(f"Detected Title Property: '{name}'")
-                    elif prop["type"] == "date":
-                        self.date_property_name = name
-                        self.logger.info(f"Detected Date Property: '{name}'")
-                    elif prop["type"] == "multi_select":
-                        self.tag_property_name = name
-                        self.logger.info(f"Detected Tag (Multi-Select) Property: '{name}'")
-            
-            filtered_results = []
-            for page in results:
-                # Check title
-                title = "Untitled"
-                props = page.get("properties", {})
-                
-                # Fetch title value irrespective of property name
-                for prop_val in props.values():
-                    if prop_val["type"] == "title":
-                        title_list = prop_val.get("title", [])
-                        if title_list:
-                            title = title_list[0].get("plain_text", "")
-                        break
-                
-                if not title.startswith("[AI Summary]"):
-                    filtered_results.append(page)
-            
-            return filtered_results
-            
-        except Exception as e:
-            self.logger.error(f"Error fetching database: {e}")
-            return []
+            for page in self._query_source_pages(edited_after):
+                yielded += 1
+                yield page
+        except NotionAPIError as e:
+            if yielded or not self._schema_from_cache:
+                raise NotionAPIError(f"Error fetching database: {e}") from e
+            # The cached schema is stale (e.g. the title property was renamed): re-detect and retry once
+            self.logger.warning(f"Query failed with the cached schema, refreshing it: {e}")
+            self.metadata_cache.invalidate(self.source_id)
+            self._detect_source_type(use_cache=False)
+            try:
+                yield from self._query_source_pages(edited_after)
+            except (NotionAPIError, requests.exceptions.RequestException) as e:
+                raise NotionAPIError(f"Error fetching database: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise NotionAPIError(f"Error fetching database: {e}") from e
 
-    def _fetch_from_page(self):
+    def _query_source_pages(self, edited_after=None):
         """
-        Fetches the parent page content AND recursively searches for 
-        child pages and child databases (even inside callouts/toggles).
+        Queries the source database (strict: a failed request raises NotionAPIError, so a stale
+        cached schema can be detected and a failed listing never ends as an empty one).
+        """
+        query_filter = self._build_query_filter(self.title_property_name, edited_after)
+        schema_detected = hasattr(self, "database_schema")
+        for page in self.query_database(self.source_id, filter=query_filter, strict=True):
+            # Without the database schema, infer property names/types from the first result
+            if not schema_detected:
+                schema_detected = True
+                self._set_database_schema(self.source_id, {
+                    name: {"type": prop.get("type")} for name, prop in page.get("properties", {}).items()
+                })
+                self.logger.info(f"Detected Title Property: '{self.title_property_name}'")
+
+            # The server filter is 'does_not_contain', keep the exact prefix check as well
+            if not self._get_page_title(page).startswith("[AI Summary]"):
+                yield page
+
+    def _fetch_from_page(self, edited_after=None):
+        """
+        Streams the parent page itself AND every child page and child database page
+        (even inside callouts/toggles, and pages nested in child pages).
+        Their text is read in the same walk and served by iter_page_text_contents.
+        Raises NotionAPIError if the source page or its listing can't be read.
         """
-        filtered_results = []
-        
         try:
             # 1. Fetch Parent Page itself
             parent_url = f"{self.base_url}/pages/{self.source_id}"
-            parent_resp = requests.get(parent_url, headers=self.headers)
-            if parent_resp.status_code == 200:
-                parent_data = parent_resp.json()
-                parent_title = "Parent Page"
-                props = parent_data.get("properties", {})
-                for prop_val in props.values():
-                   if prop_val["type"] == "title":
-                       t_list = prop_val.get("title", [])
-                       if t_list:
-                           parent_title = t_list[0].get("plain_text", "Parent Page")
-                       break
-                
-                if not parent_title.startswith("[AI Summary]"):
-                    self.logger.info(f"Adding Parent Page: {parent_title}")
-                    filtered_results.append(parent_data)
+            parent_resp = self._request("get", parent_url)
+            if parent_resp.status_code != 200:
+                raise NotionAPIError(f"HTTP {parent_resp.status_code} for {parent_url}: {parent_resp.text}")
 
-            # 2. Recursive Search for Children
+            # 2. Single-pass search for children (and their text)
             self.logger.info("Scanning for nested pages and databases...")
-            nested_items = self._collect_nested_content(self.source_id)
-            filtered_results.extend(nested_items)
-            
-            return filtered_results
-            
-        except Exception as e:
-            self.logger.error(f"Error fetching page content: {e}")
-            return []
+            yield from self._walk_nested_pages(parent_resp.json(), edited_after=edited_after)
+        except requests.exceptions.RequestException as e:
+            raise NotionAPIError(f"Error fetching page content: {e}") from e
 
-    def _collect_nested_content(self, block_id, depth=0):
+    def _walk_nested_pages(self, source_page, edited_after=None):
         """
-        Recursively fetches blocks to find child_page and child_database.
-        Limit depth to prevent infinite loops or excessive interaction.
+        Single-pass traversal of the source page: one walk over the block trees both discovers
+        child pages / inline database pages (and pages nested in them) and reads the blocks their
+        text is rendered from, so no block is listed twice.
+        Pages to summarize are yielded as soon as their own subtree is read; their text is kept
+        for iter_page_text_contents. A page whose cached text is current is not walked: the child
+        pages/databases recorded with it are re-checked instead. Summary pages are never entered.
         """
-        found_items = []
-        if depth > 3: # Optimized depth limit to 3
-            return found_items
+        tree = {}
+        failed = {} # root id -> "error" | "limit"
+        seen = set()
+        walked = {} # page id -> page object, for pages whose blocks are listed
+        summarize = set() # ids of the pages to yield
+        nested = {} # page id -> child pages/databases found in its blocks (stored with its text)
+        cached = deque() # (page, text) served from the cache, yielded between walk steps
+        unchecked = [] # nested pages of cached pages that could not be re-checked
+        found = 0
+        from_cache = 0
 
-        url = f"{self.base_url}/blocks/{block_id}/children"
+        def add_page(page):
+            # Returns the ids of the pages to walk (a cached page's nested pages instead of itself)
+            nonlocal found, from_cache
+            if page["id"] in seen:
+                return []
+            seen.add(page["id"])
+            title = self._get_page_title(page)
+            is_source = normalize_id(page["id"]) == normalize_id(self.source_id)
+            if title.startswith("[AI Summary]") and not is_source:
+                return []
+            wanted = not title.startswith("[AI Summary]") and self._edited_since(page, edited_after)
+            if wanted:
+                self.logger.info(f"Adding Parent Page: {title}" if is_source else f"Found Child Page: {title}")
+                found += 0 if is_source else 1
+            entry = self.cache.get_entry(page["id"], page.get("last_edited_time"), require_nested=True) \
+                if self.cache else None
+            if entry is None:
+                walked[page["id"]] = page
+                nested[page["id"]] = []
+                if wanted:
+                    summarize.add(page["id"])
+                return [page["id"]]
+            text, stubs = entry
+            from_cache += 1
+            if wanted:
+                cached.append((page, text))
+            return recheck(stubs)
+
+        def recheck(stubs):
+            # Nested pages of a cached page: their current state decides whether they are walked
+            to_walk = []
+            child_pages = [stub["id"] for stub in stubs if stub["type"] == "child_page"]
+            for page_id, page in zip(child_pages, self._get_executor().map(self._get_nested_page, child_pages)):
+                if page is False:
+                    unchecked.append(page_id)
+                elif page is not None:
+                    to_walk += add_page(page)
+            for stub in stubs:
+                if stub["type"] == "child_database":
+                    for page in self._fetch_pages_from_inline_db(stub["id"], edited_after=edited_after):
+                        to_walk += add_page(page)
+            return to_walk
+
+        def discover(block, root_id):
+            b_type = block["type"]
+            title = block[b_type].get("title") or ("Untitled" if b_type == "child_page" else "Untitled Database")
+            nested[root_id].append({"id": block["id"], "type": b_type, "title": title})
+            if b_type == "child_page":
+                # Mock structure for consistency
+                mock_page = block.copy()
+                mock_page['properties'] = {
+                    "title": { "type": "title", "title": [{"plain_text": title}] }
+                }
+                return add_page(mock_page)
+
+            # Child Database: its pages are walked as new roots
+            self.logger.info(f"Found Inline Database: {title}")
+            to_walk = []
+            for page in self._fetch_pages_from_inline_db(block["id"], edited_after=edited_after):
+                to_walk += add_page(page)
+            return to_walk
+
+        steps = self._iter_block_trees(add_page(source_page), tree, failed, discover=discover)
+        while True:
+            while cached:
+                page, text = cached.popleft()
+                self._prefetched[page["id"]] = (text, None)
+                yield page
+            step = next(steps, None)
+            if step is None:
+                break
+            root_id, owned = step
+            # The subtree is complete: render it and drop its blocks
+            text = self._render_block_tree(root_id, tree)
+            for block_id in owned:
+                tree.pop(block_id, None)
+            stubs = nested.pop(root_id)
+            if normalize_id(root_id) == normalize_id(self.source_id) and failed.get(root_id) == "error":
+                raise NotionAPIError(f"Error fetching page content: the blocks of {root_id} could not be read")
+            if root_id not in summarize:
+                if self.cache and root_id not in failed:
+                    self.cache.put(walked[root_id], text, stubs)
+                continue
+            if failed.get(root_id) != "error":
+                # A page cut off by max_depth / max_nodes would be cut off the same way again: keep
+                # its text, but not for the cache (nested None). A failed fetch is retried later.
+                self._prefetched[root_id] = (text, None if root_id in failed else stubs)
+            yield walked[root_id]
+
+        self.logger.info(f"Found {found} nested pages ({len(walked)} pages walked, "
+                         f"{from_cache} served from cache).")
+        if failed or unchecked:
+            self.logger.warning(f"{len(failed) + len(unchecked)} pages could not be read completely; "
+                                f"nested pages below them may be missing.")
+        else:
+            self.listing_complete = edited_after is None
+
+    def _get_nested_page(self, page_id):
+        """
+        Current page object of a child page (None if it was deleted/archived, False if it can't be read).
+        """
         try:
-            response = requests.get(url, headers=self.headers)
-            if response.status_code != 200:
-                return found_items
-            
-            results = response.json().get("results", [])
-            
-            for block in results:
-                b_type = block["type"]
-                
-                # Case A: Child Page
-                if b_type == "child_page":
-                    title = block["child_page"].get("title", "Untitled")
-                    if not title.startswith("[AI Summary]"):
-                        # Mock structure for consistency
-                        mock_page = block.copy()
-                        mock_page['properties'] = {
-                            "title": { "type": "title", "title": [{"plain_text": title}] }
-                        }
-                        found_items.append(mock_page)
-                        self.logger.info(f"Found Child Page: {title}")
-
-                # Case B: Child Database
-                elif b_type == "child_database":
-                    db_title = block["child_database"].get("title", "Untitled Database")
-                    self.logger.info(f"Found Inline Database: {db_title}")
-                    # Query this database to get its pages
-                    db_pages = self._fetch_pages_from_inline_db(block["id"])
-                    found_items.extend(db_pages)
-
-                # Case C: Container Block (Callout, Toggle, Column, etc.)
-                # If it has children, recurse!
-                elif block.get("has_children"):
-                    nested = self._collect_nested_content(block["id"], depth + 1)
-                    found_items.extend(nested)
-                    
-        except Exception as e:
-            self.logger.error(f"Error traversing block {block_id}: {e}")
-            
-        return found_items
+            response = self._request("get", f"{self.base_url}/pages/{page_id}")
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"Could not re-check child page {page_id}: {e}")
+            return False
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            self.logger.warning(f"Could not re-check child page {page_id}: HTTP {response.status_code}")
+            return False
+        page = response.json()
+        return None if page.get("archived") or page.get("in_trash") else page
 
-    def _fetch_pages_from_inline_db(self, database_id):
+    @staticmethod
+    def _synced_source(block):
         """
-        Queries an inline database found inside a page.
+        Id of the block holding a synced block's content (the original for copies).
         """
-        url = f"{self.base_url}/databases/{database_id}/query"
+        synced_from = block.get("synced_block", {}).get("synced_from") or {}
+        return synced_from.get("block_id") or block["id"]
+
+    def _fetch_pages_from_inline_db(self, database_id, edited_after=None):
+        """
+        Streams the pages of an inline database found inside a page.
+        Raises NotionAPIError if the query fails (the page listing would be incomplete).
+        """
+        query_filter = self._build_query_filter(edited_after=edited_after)
+        count = 0
         try:
-            response = requests.post(url, headers=self.headers, json={})
-            if response.status_code != 200:
-                return []
-            
-            results = response.json().get("results", [])
-            valid_pages = []
-            for page in results:
-                title = "Untitled"
-                props = page.get("properties", {})
-                for prop_val in props.values():
-                    if prop_val["type"] == "title":
-                        t_list = prop_val.get("title", [])
-                        if t_list:
-                            title = t_list[0].get("plain_text", "")
-                        break
-                
-                if not title.startswith("[AI Summary]"):
-                    valid_pages.append(page)
-            
-            self.logger.info(f"  -> Extracted {len(valid_pages)} pages from inline DB.")
-            return valid_pages
-        except Exception as e:
-            self.logger.error(f"Error querying inline DB {database_id}: {e}")
-            return []
+            for page in self.query_database(database_id, filter=query_filter, strict=True):
+                if not self._get_page_title(page).startswith("[AI Summary]"):
+                    count += 1
+                    yield page
+        except (NotionAPIError, requests.exceptions.RequestException) as e:
+            raise NotionAPIError(f"Error querying inline DB {database_id}: {e}") from e
+
+        self.logger.info(f"  -> Extracted {count} pages from inline DB.")
 
     def get_page_text_content(self, page_id):
         """
-        Recursively retrieves text content from a page's blocks, including nested blocks
-        (Callouts, Toggles, Columns, etc.).
+        Retrieves text content from a page's blocks, including nested blocks
+        (Callouts, Toggles, Columns, etc.). Sibling subtrees are fetched concurrently.
         """
-        return self._get_block_text_recursive(page_id)
+        return self.get_pages_text_content([page_id])[page_id]
 
-    def _get_block_text_recursive(self, block_id, depth=0):
+    def get_pages_text_content(self, page_ids):
         """
-        DFS to traverse block children and extract text.
+        Fetches the block trees of several pages in parallel.
+        Returns {page_id: text} with each text in the original document order.
         """
-        all_text = []
-        if depth > 3: # Limit depth to optimize speed
-            return ""
+        texts, _ = self._fetch_page_texts(page_ids)
+        return texts
+
+    def _fetch_page_texts(self, page_ids):
+        """
+        Same as get_pages_text_content, also returning the set of pages that
+        could not be read completely (so they are not cached as if they were).
+        """
+        tree, failed = self._fetch_block_trees(page_ids)
+        texts = {page_id: self._render_block_tree(page_id, tree) for page_id in page_ids}
+        return texts, failed
+
+    def iter_page_text_contents(self, pages, batch_size=None):
+        """
+        Yields (page, text) for each page, in input order.
+        Pages are grouped in batches whose block trees are fetched together.
+        """
+        batch_size = batch_size or self.max_concurrency
+        batch = []
+        for page in pages:
+            batch.append(page)
+            if len(batch) >= batch_size:
+                yield from self._iter_text_batch(batch)
+                batch = []
+        if batch:
+            yield from self._iter_text_batch(batch)
 
+    def _iter_text_batch(self, pages):
+        texts = {}
+        for page in pages:
+            # Text already read while the pages were discovered (page mode single-pass walk);
+            # nested is None when it must not be stored (served from the cache, or cut off by limits)
+            prefetched = self._prefetched.pop(page["id"], None)
+            if prefetched is not None:
+                texts[page["id"]], nested = prefetched
+                if self.cache and nested is not None:
+                    self.cache.put(page, texts[page["id"]], nested)
+            elif self.cache:
+                cached = self.cache.get(page["id"], page.get("last_edited_time"))
+                if cached is not None:
+                    texts[page["id"]] = cached
+
+        stale = [page for page in pages if page["id"] not in texts]
+        if stale:
+            fetched, failed = self._fetch_page_texts([page["id"] for page in stale])
+            texts.update(fetched)
+            if self.cache:
+                for page in stale:
+                    if page["id"] not in failed:
+                        self.cache.put(page, fetched[page["id"]])
+
+        for page in pages:
+            if self.snapshot:
+                self.snapshot.add(page, texts[page["id"]])
+            yield page, texts[page["id"]]
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="notion")
+        return self._executor
+
+    def close(self):
+        """
+        Releases the worker threads used for concurrent fetching, the page cache and the
+        connection pool (an injected session is left open for its owner).
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        self._reset_memos()
+        if self._owns_session:
+            self.session.close()
+
+    def _reset_memos(self):
+        with self._memo_lock:
+            self._synced_children = {}
+            self._link_titles = {}
+            self._prefetched = {}
+
+    @property
+    def inline_child_pages(self):
+        """
+        Whether child pages are rendered inside their parent's text. In page mode they are
+        discovered and summarized as pages of their own, so inlining them would duplicate them.
+        """
+        return self.source_type != "page"
+
+    def _fetch_block_trees(self, root_ids, max_depth=None, max_nodes=None):
+        """
+        Fetches the block trees of several roots at once (see _iter_block_trees).
+        Returns ({block_id: [child blocks]}, {root ids read incompletely: a failed fetch or a
+        max_depth / max_nodes cut-off}); their text is never cached as complete.
+        """
+        tree = {}
+        failed = {}
+        for _ in self._iter_block_trees(root_ids, tree, failed, max_depth=max_depth, max_nodes=max_nodes):
+            pass
+        return tree, set(failed)
+
+    def _iter_block_trees(self, root_ids, tree, failed, max_depth=None, max_nodes=None, discover=None):
+        """
+        Iterative concurrent traversal: every block with children is fetched as soon as its parent's
+        listing arrives, with at most max_concurrency requests in flight.
+        Each block id is fetched once (visited set). Synced block copies read their original's
+        children, memoized across pages; link_to_page targets are resolved to titles (memoized).
+        max_depth / max_nodes (per root) default to the connector's limits; None means no limit.
+        discover: optional callback(block, root_id) for child_page / child_database blocks, returning
+        the ids of pages to traverse as new roots in the same walk (see _walk_nested_pages).
+        Fills tree ({block_id: [child blocks]}) and failed ({root_id: "error" | "limit"} for roots
+        read incompletely), and yields (root_id, [block ids listed for it]) as soon as a root's
+        subtree is complete, so it can be rendered before the whole walk is done.
+        """
+        max_depth = self.max_depth if max_depth is None else max_depth
+        max_nodes = self.max_nodes if max_nodes is None else max_nodes
+        executor = self._get_executor()
+        pending = {}
+        ready = deque() # listings answered from the memo, expanded without a request
+        queued = set()
+        waiting = {} # listed block id -> [(block_id, depth, root_id)] expanded with its children
+        nodes = {}
+        outstanding = {} # root id -> listings scheduled but not expanded yet
+        owned = {} # root id -> block ids listed for it
+        links = {} # root id -> link_to_page targets
+        completed = deque()
+
+        def schedule(block_id, depth, root_id, source_id, shared):
+            # source_id: the block whose children are listed (the original for a synced copy)
+            if block_id in queued:
+                return
+            if max_depth is not None and depth > max_depth:
+                # Cut off: the root's text is incomplete, so it must not be cached as complete
+                if root_id not in failed:
+                    self.logger.warning(f"Depth limit ({max_depth}) reached for {root_id}, deeper content skipped.")
+                failed.setdefault(root_id, "limit")
+                return
+            with self._memo_lock:
+                memo = self._synced_children.get(source_id) if shared else None
+            if memo is not None:
+                queued.add(block_id)
+                ready.append((block_id, depth, root_id, memo, shared))
+            elif shared and source_id in waiting:
+                # Same synced original already being fetched: reuse that response
+                queued.add(block_id)
+                waiting[source_id].append((block_id, depth, root_id))
+            elif max_nodes and nodes.get(root_id, 0) >= max_nodes:
+                if root_id not in failed:
+                    self.logger.warning(f"Node budget ({max_nodes}) reached for {root_id}, deeper content skipped.")
+                failed.setdefault(root_id, "limit")
+                return
+            else:
+                queued.add(block_id)
+                nodes[root_id] = nodes.get(root_id, 0) + 1
+                future = executor.submit(self._list_block_children, source_id)
+                pending[future] = (source_id, shared)
+                waiting[source_id] = [(block_id, depth, root_id)]
+            outstanding[root_id] = outstanding.get(root_id, 0) + 1
+
+        def start(root_id, children=None):
+            # children=[]: a page known to be empty, nothing to list
+            if root_id in outstanding:
+                return
+            outstanding[root_id] = 0
+            if children is not None:
+                queued.add(root_id)
+                ready.append((root_id, 0, root_id, children, False))
+                outstanding[root_id] += 1
+            else:
+                schedule(root_id, 0, root_id, root_id, False)
+            if not outstanding[root_id]:
+                completed.append(root_id)
+
+        def expand(block_id, depth, root_id, children, shared):
+            tree[block_id] = children
+            # Synced content may be rendered under other roots too, so it is not handed to this one
+            owned.setdefault(root_id, [])
+            if not shared:
+                owned[root_id].append(block_id)
+            for block in children:
+                b_type = block.get("type")
+                if b_type == "link_to_page":
+                    links.setdefault(root_id, set()).add(self._link_target(block))
+                if b_type == "synced_block":
+                    # Everything under a synced block may be shown on other pages too: memoize it
+                    schedule(block["id"], depth + 1, root_id, self._synced_source(block), True)
+                elif discover and b_type in ("child_page", "child_database"):
+                    for page_id in discover(block, root_id):
+                        empty = b_type == "child_page" and page_id == block["id"] and not block.get("has_children")
+                        start(page_id, [] if empty else None)
+                elif not block.get("has_children"):
+                    continue
+                elif b_type == "child_page" and not self.inline_child_pages:
+                    continue
+                else:
+                    schedule(block["id"], depth + 1, root_id, block["id"], shared)
+            outstanding[root_id] -= 1
+            if not outstanding[root_id]:
+                completed.append(root_id)
+
+        for root_id in dict.fromkeys(root_ids):
+            start(root_id)
+
+        while pending or ready or completed:
+            if completed:
+                root_id = completed.popleft()
+                self._resolve_link_titles(links.pop(root_id, set()) - {None})
+                yield root_id, owned.pop(root_id, [])
+                continue
+            if ready:
+                expand(*ready.popleft())
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source_id, shared = pending.pop(future)
+                children = future.result()
+                if children is not None and shared:
+                    with self._memo_lock:
+                        self._synced_children[source_id] = children
+                for block_id, depth, root_id in waiting.pop(source_id):
+                    if children is None:
+                        failed[root_id] = "error"
+                    expand(block_id, depth, root_id, children or [], shared)
+
+    @staticmethod
+    def _link_target(block):
+        """
+        ('page_id' | 'database_id', id) of a link_to_page block, or None.
+        """
+        link = block.get("link_to_page") or {}
+        kind = link.get("type")
+        return (kind, link[kind]) if kind in ("page_id", "database_id") and link.get(kind) else None
+
+    def _resolve_link_titles(self, targets):
+        """
+        Fetches the titles of linked pages/databases not resolved yet (concurrently, once per target).
+        """
+        with self._memo_lock:
+            missing = [t for t in targets if t not in self._link_titles]
+        if not missing:
+            return
+        for target, title in zip(missing, self._get_executor().map(self._fetch_link_title, missing)):
+            with self._memo_lock:
+                self._link_titles[target] = title
+
+    def _fetch_link_title(self, target):
+        kind, object_id = target
+        endpoint = "pages" if kind == "page_id" else "databases"
+        try:
+            response = self._request("get", f"{self.base_url}/{endpoint}/{object_id}")
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"Could not resolve linked {endpoint[:-1]} {object_id}: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        if kind == "database_id":
+            return "".join(t.get("plain_text", "") for t in data.get("title", [])) or "Untitled Database"
+        return self._get_page_title(data)
+
+    def _list_block_children(self, block_id):
+        """
+        Returns all child blocks of a block (following pagination), or None if they couldn't be read.
+        """
         url = f"{self.base_url}/blocks/{block_id}/children"
         try:
-            response = requests.get(url, headers=self.headers)
-            if response.status_code != 200:
-                 self.logger.error(f"Error getting blocks: {response.text}")
-                 return ""
-                 
-            blocks = response.json().get("results", [])
-            for block in blocks:
-                b_type = block.get("type")
-                content = ""
-                
-                # Extract text from supported block types
-                # Added 'callout', 'toggle' to checking list just in case they have direct text
-                text_types = [
-                    "paragraph", "heading_1", "heading_2", "heading_3", 
-                    "bulleted_list_item", "numbered_list_item", "to_do", 
-                    "quote", "callout", "toggle"
-                ]
-                
-                if b_type in text_types:
-                     # Most blocks use "rich_text"
-                     # Callout also uses "rich_text" inside its object
-                     obj = block.get(b_type, {})
-                     rich_text = obj.get("rich_text", [])
-                     if rich_text:
-                         text_str = "".join([t.get("plain_text", "") for t in rich_text])
-                         if text_str:
-                             # Add some formatting context
-                             if b_type == "heading_1": content = f"# {text_str}"
-                             elif b_type == "heading_2": content = f"## {text_str}"
-                             elif b_type == "heading_3": content = f"### {text_str}"
-                             elif b_type == "bulleted_list_item": content = f"- {text_str}"
-                             elif b_type == "numbered_list_item": content = f"1. {text_str}"
-                             elif b_type == "to_do": 
-                                 checked = "x" if obj.get("checked") else " "
-                                 content = f"- [{checked}] {text_str}"
-                             elif b_type == "quote": content = f"> {text_str}"
-                             elif b_type == "callout": content = f"> 💡 {text_str}" # Distinguish callout
-                             else: content = text_str
-                
-                if content:
-                    all_text.append(content)
-                
-                # RECURSION: Check for children (Callouts, Toggles, Columns, etc.)
-                if block.get("has_children"):
-                    nested_text = self._get_block_text_recursive(block["id"], depth + 1)
-                    if nested_text:
-                        # Indent nested text for better structure context (optional but good)
-                        all_text.append(nested_text)
-
-            return "\n".join(all_text)
-            
+            return list(self._paginate("get", url, strict=True))
         except Exception as e:
             self.logger.error(f"Error reading page content {block_id}: {e}")
-            return ""
+            return None
 
-    def create_summary_page(self, original_page_id, original_title, summary_content):
+    def _render_block_tree(self, block_id, tree):
         """
-        Creates a new PAGE (row) in the DATABASE with the summary.
-        Handles long summaries by splitting into multiple blocks.
+        Iterative DFS over the already-fetched tree to extract text in document order.
+        A block already on the current path is not entered again (cycle guard).
         """
-        url = f"{self.base_url}/pages"
-        
-        # Use the detected title property name
-        prop_name = self.title_property_name
-        
+        all_text = []
+        stack = [(block_id, iter(tree.get(block_id, [])))]
+        path = {block_id}
+        while stack:
+            parent_id, children = stack[-1]
+            block = next(children, None)
+            if block is None:
+                stack.pop()
+                path.discard(parent_id)
+                continue
+
+            if block.get("type") == "link_to_page":
+                with self._memo_lock:
+                    title = self._link_titles.get(self._link_target(block))
+                content = f"↗ {title}" if title else ""
+            else:
+                content = self._render_block(block)
+            if content:
+                all_text.append(content)
+
+            # Nested content (Callouts, Toggles, Columns, synced blocks, etc.). A child page fetched
+            # in the same batch as its own root is still not inlined in page mode.
+            child_id = block["id"]
+            if block.get("type") == "child_page" and not self.inline_child_pages:
+                continue
+            if child_id in tree and child_id not in path:
+                path.add(child_id)
+                stack.append((child_id, iter(tree[child_id])))
+
+        return "\n".join(all_text)
+
+    def _render_block(self, block):
+        """
+        Converts a single block to a line of markdown-ish text ("" if it has no text).
+        Dispatch is a table lookup (renderers.BLOCK_RENDERERS).
+        """
+        return render_block(block)
+
     def create_summary_page(self, original_page_id, original_title, summary_content):
         """
         Creates a new PAGE (row) in the DATABASE with the summary.
         Parses Markdown to create appropriate Notion blocks.
-        Sets '날짜' to today and '유형' to '요약'.
+        Sets the detected date property to today and the tag property to '요약'.
+        Notion accepts at most 100 children per request, so the page is created with the
+        first batch and the rest is appended in order (see append_blocks). If an append fails
+        the partial page is archived again, so a retry doesn't leave a truncated duplicate.
         """
-        from datetime import datetime
         url = f"{self.base_url}/pages"
         
         # Use the detected title property name
@@ -329,13 +952,15 @@ class NotionConnector:
         # Parse Summary Content into Notion Blocks
         summary_blocks = self._parse_markdown_to_blocks(summary_content)
         
-        # Prepare Children Blocks (Only summary content)
-        children_blocks = summary_blocks
+        # First batch goes with the page creation, the rest is appended afterwards
+        first_batch = summary_blocks[:MAX_BLOCKS_PER_REQUEST]
+        remaining_blocks = summary_blocks[MAX_BLOCKS_PER_REQUEST:]
         
         today = datetime.now().strftime("%Y-%m-%d")
         
         # Prepare Payload
         properties_payload = {}
+        optional_properties = []
         
         # 1. DATABASE MODE
         if self.source_type == "database":
@@ -351,15 +976,17 @@ class NotionConnector:
                 properties_payload[self.date_property_name] = {
                     "date": { "start": today }
                 }
+                optional_properties.append(self.date_property_name)
             if hasattr(self, 'tag_property_name'):
                 properties_payload[self.tag_property_name] = {
                     "multi_select": [ {"name": "요약"} ]
                 }
+                optional_properties.append(self.tag_property_name)
             
             payload = {
                 "parent": {"database_id": self.source_id},
                 "properties": properties_payload,
-                "children": children_blocks
+                "children": first_batch
             }
             
         # 2. PAGE MODE
@@ -374,29 +1001,70 @@ class NotionConnector:
                         }
                     ]
                 },
-                "children": children_blocks
+                "children": first_batch
             }
         
+        new_page = None
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self._request("post", url, idempotent=False, json=payload)
             if response.status_code != 200:
                 self.logger.error(f"Error creating summary page: {response.text}")
-                # Fallback: Try without headers if they fail (e.g. wrong property names)
-                if "validation_error" in response.text:
-                    self.logger.warning("Retrying creation without '날짜'/'유형' properties (might be incorrect names)...")
-                    del properties_payload["날짜"]
-                    del properties_payload["유형"]
+                # Fallback: Try without the optional date/tag properties (e.g. wrong property types)
+                if "validation_error" in response.text and optional_properties:
+                    self.logger.warning("Retrying creation without the date/tag properties (might be incorrect types)...")
+                    for name in optional_properties:
+                        properties_payload.pop(name, None)
                     payload["properties"] = properties_payload
-                    response = requests.post(url, headers=self.headers, json=payload)
-                    if response.status_code == 200:
-                        return response.json()
-                        
+                    response = self._request("post", url, idempotent=False, json=payload)
+                if response.status_code != 200:
+                    return None
+
+            new_page = response.json()
+            if remaining_blocks and not self.append_blocks(new_page["id"], remaining_blocks):
+                self.logger.error("Summary page was created but not all blocks could be appended, archiving it.")
+                self._archive_partial_page(new_page["id"])
                 return None
-            return response.json()
+            return new_page
         except Exception as e:
             self.logger.error(f"Error creating summary page: {e}")
+            if new_page:
+                self._archive_partial_page(new_page["id"])
             return None
 
+    def _archive_partial_page(self, page_id):
+        try:
+            if self.archive_page(page_id):
+                return
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"Could not archive page {page_id}: {e}")
+        self.logger.error(f"Incomplete summary page {page_id} is left in Notion; delete it by hand.")
+
+    def archive_page(self, page_id):
+        """
+        Archives (moves to trash) a page, e.g. an outdated per-page summary. Returns True on success.
+        """
+        response = self._request("patch", f"{self.base_url}/pages/{page_id}", json={"archived": True})
+        if response.status_code != 200:
+            self.logger.warning(f"Could not archive page {page_id}: {response.text}")
+            return False
+        return True
+
+    def append_blocks(self, block_id, blocks):
+        """
+        Appends blocks under a page/block in batches of 100 (Notion's per-request limit), in order.
+        Each batch goes through the retrying request layer. Returns True when every batch succeeded.
+        """
+        url = f"{self.base_url}/blocks/{block_id}/children"
+        total_batches = (len(blocks) + MAX_BLOCKS_PER_REQUEST - 1) // MAX_BLOCKS_PER_REQUEST
+        for batch_index, start in enumerate(range(0, len(blocks), MAX_BLOCKS_PER_REQUEST)):
+            batch = blocks[start:start + MAX_BLOCKS_PER_REQUEST]
+            response = self._request("patch", url, idempotent=False, json={"children": batch})
+            if response.status_code != 200:
+                self.logger.error(f"Error appending blocks (batch {batch_index + 1}/{total_batches}): {response.text}")
+                return False
+            self.logger.info(f"  -> Appended batch {batch_index + 1}/{total_batches} ({len(batch)} blocks)")
+        return True
+
     def _parse_markdown_to_blocks(self, text):
         """
         Simple Markdown parser to convert text lines into Notion blocks.
@@ -407,72 +1075,50 @@ class NotionConnector:
             line = line.strip()
             if not line:
                 continue
-            
-            # Truncate extremely long lines limit to safe guard against 400 bad request
-            if len(line) > 2000:
-                line = line[:2000]
 
-            block = None
-            
             if line == '---' or line == '***' or line == '___':
-                block = {
+                blocks.append({
                     "object": "block",
                     "type": "divider",
                     "divider": {}
-                }
+                })
             elif line.startswith('# '):
-                block = {
-                    "object": "block",
-                    "type": "heading_1",
-                    "heading_1": {"rich_text": self._parse_rich_text(line[2:])}
-                }
+                blocks.extend(self._text_blocks("heading_1", line[2:]))
             elif line.startswith('## '):
-                block = {
-                    "object": "block",
-                    "type": "heading_2",
-                    "heading_2": {"rich_text": self._parse_rich_text(line[3:])}
-                }
+                blocks.extend(self._text_blocks("heading_2", line[3:]))
             elif line.startswith('### '):
-                block = {
-                    "object": "block",
-                    "type": "heading_3",
-                    "heading_3": {"rich_text": self._parse_rich_text(line[4:])}
-                }
+                blocks.extend(self._text_blocks("heading_3", line[4:]))
             elif line.startswith('- ') or line.startswith('* '):
-                 block = {
-                    "object": "block",
-                    "type": "bulleted_list_item",
-                    "bulleted_list_item": {"rich_text": self._parse_rich_text(line[2:])}
-                }
+                blocks.extend(self._text_blocks("bulleted_list_item", line[2:]))
             elif len(line) > 2 and line[0].isdigit() and line[1] == '.' and line[2] == ' ': # check "1. "
-                 content = line[3:]
-                 block = {
-                    "object": "block",
-                    "type": "numbered_list_item",
-                    "numbered_list_item": {"rich_text": self._parse_rich_text(content)}
-                }
+                blocks.extend(self._text_blocks("numbered_list_item", line[3:]))
             elif line.startswith('> '):
-                 block = {
-                    "object": "block",
-                    "type": "quote",
-                    "quote": {"rich_text": self._parse_rich_text(line[2:])}
-                }
+                blocks.extend(self._text_blocks("quote", line[2:]))
             else:
-                 block = {
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {"rich_text": self._parse_rich_text(line)}
-                }
-            
-            if block:
-                blocks.append(block)
+                blocks.extend(self._text_blocks("paragraph", line))
                 
         return blocks
 
+    def _text_blocks(self, b_type, text):
+        """
+        Builds block(s) of the given type. A block holds at most 100 rich_text segments,
+        so extremely long lines continue in further blocks of the same type instead of being cut.
+        """
+        rich_text = self._parse_rich_text(text)
+        return [
+            {
+                "object": "block",
+                "type": b_type,
+                b_type: {"rich_text": rich_text[i:i + MAX_RICH_TEXT_SEGMENTS]}
+            }
+            for i in range(0, len(rich_text), MAX_RICH_TEXT_SEGMENTS)
+        ]
+
     def _parse_rich_text(self, text):
         """
         Parses text for simple markdown formatting (currently only **bold**).
-        Returns a list of Notion rich_text objects.
+        Returns a list of Notion rich_text objects; text longer than 2000 characters
+        (Notion's per-segment limit) is split into several segments.
         """
         rich_text = []
         # Split by ** to identify bold parts
@@ -485,14 +1131,91 @@ class NotionConnector:
             # Even index parts are normal text, Odd index parts are bold
             is_bold = (i % 2 == 1)
             
-            text_obj = {
-                "text": {"content": part},
-                "annotations": {"bold": is_bold}
-            }
-            rich_text.append(text_obj)
+            for start in range(0, len(part), MAX_TEXT_LENGTH):
+                rich_text.append({
+                    "text": {"content": part[start:start + MAX_TEXT_LENGTH]},
+                    "annotations": {"bold": is_bold}
+                })
             
         if not rich_text:
              # Fallback if empty
-             return [{"text": {"content": text}}]
+             return [{"text": {"content": text[:MAX_TEXT_LENGTH]}}]
              
         return rich_text
+
+
+class SummaryPageStream:
+    """
+    Progressive writer for a summary page that is still being generated.
+    Streamed text is split into completed markdown lines, parsed into blocks and handed to a
+    background thread that appends them in batches, so uploading overlaps with generation.
+    """
+    def __init__(self, connector, page_id, batch_size=MAX_BLOCKS_PER_REQUEST, flush_interval=2.0):
+        self.connector = connector
+        self.page_id = page_id
+        self.batch_size = batch_size
+        # Pending blocks are sent at least this often (seconds), even if the batch isn't full
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(__name__)
+
+        self._buffer = ""
+        self._queue = queue.Queue()
+        self._ok = True
+        self.blocks_written = 0
+        self._thread = threading.Thread(target=self._upload_loop, name="notion-upload", daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        """
+        Feeds generated text; every completed line is parsed and queued for upload.
+        """
+        self._buffer += text
+        if "\n" not in self._buffer:
+            return
+        complete, self._buffer = self._buffer.rsplit("\n", 1)
+        blocks = self.connector._parse_markdown_to_blocks(complete)
+        if blocks:
+            self._queue.put(blocks)
+
+    def close(self):
+        """
+        Flushes the last (unterminated) line, waits for the uploads and returns True if all succeeded.
+        """
+        if self._buffer.strip():
+            self._queue.put(self.connector._parse_markdown_to_blocks(self._buffer))
+        self._buffer = ""
+        self._queue.put(None)
+        self._thread.join()
+        return self._ok
+
+    def _upload_loop(self):
+        pending = []
+        deadline = None
+        done = False
+        while not done:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is None:
+                    done = True
+                else:
+                    pending.extend(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            if pending and (done or len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                if self._ok:
+                    try:
+                        appended = self.connector.append_blocks(self.page_id, pending)
+                    except Exception as e:
+                        # Keep draining the queue: close() must not wait on a dead thread
+                        self.logger.error(f"Error appending blocks to {self.page_id}: {e}")
+                        appended = False
+                    if appended:
+                        self.blocks_written += len(pending)
+                    else:
+                        self._ok = False
+                pending = []
+                deadline = None
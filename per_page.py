@@ -0,0 +1,134 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cache import SummaryIndex, content_hash
+from corpus import format_document
+from metrics import metrics
+from notion_connector import NotionAPIError
+
+
+class PerPageRunner:
+    """
+    Per-page mode: every source page gets its own '[AI Summary] <title>' page.
+    Pages are summarized by a worker pool (at most `concurrency` pages in flight) while the
+    listing and text extraction keep going. A local index maps page id -> summary page id and
+    the hash of what was summarized, so unchanged pages are skipped on the next run and
+    changed pages replace their previous summary.
+    """
+    def __init__(self, notion, summarizer, concurrency=4, index=None):
+        self.notion = notion
+        self.summarizer = summarizer
+        self.concurrency = max(1, concurrency)
+        self.index = index or SummaryIndex(notion.source_id)
+        self.logger = logging.getLogger(__name__)
+
+        self.lock = threading.Lock()
+        self.counts = {"pages": 0, "summarized": 0, "unchanged": 0, "empty": 0, "failed": 0}
+
+    def run(self, user_instruction, pages=None):
+        """
+        Summarizes every page (default: all unsummarized pages of the source).
+        Returns a result dict with 'status', the per-page counts and 'summaries' (page id -> summary page id).
+        """
+        result = {"status": "failed", "pages": 0, "report_page_id": None, "error": None, "summaries": {}}
+        with self.lock:
+            self.counts = dict.fromkeys(self.counts, 0)
+        if pages is None:
+            pages = self.notion.iter_unsummarized_pages()
+
+        in_flight = threading.BoundedSemaphore(self.concurrency)
+        futures = []
+        listing_error = None
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                for page, page_content in self.notion.iter_page_text_contents(pages):
+                    with self.lock:
+                        self.counts["pages"] += 1
+                    title, props_text = self.notion.extract_page_properties(page)
+                    document = format_document(title, props_text, page_content)
+                    # The instruction is part of the hash: a different request re-summarizes every page
+                    digest = content_hash(document, user_instruction)
+
+                    previous = self.index.get(page["id"])
+                    if previous and previous[0] == digest:
+                        self._count("unchanged")
+                        continue
+                    if len(page_content.strip()) < 10:
+                        self._count("empty")
+                        continue
+
+                    # Blocks when `concurrency` pages are being summarized: backpressure on extraction
+                    in_flight.acquire()
+                    future = executor.submit(self._summarize_page, page["id"], title, document, digest,
+                                             previous[1] if previous else None, user_instruction)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append((page["id"], future))
+            except NotionAPIError as e:
+                # Incomplete listing: pages already submitted are finished, but the run has failed
+                self.logger.error(f"Failed to list pages: {e}")
+                listing_error = e
+
+            for page_id, future in futures:
+                summary_page_id = future.result()
+                if summary_page_id:
+                    result["summaries"][page_id] = summary_page_id
+
+        result["pages"] = self.counts["pages"]
+        result.update(self.counts)
+        self.logger.info(
+            f"Per-page summaries: {self.counts['summarized']} written, {self.counts['unchanged']} unchanged, "
+            f"{self.counts['empty']} empty, {self.counts['failed']} failed (of {self.counts['pages']} pages)."
+        )
+        if listing_error:
+            result["error"] = str(listing_error)
+        elif self.counts["failed"]:
+            result["error"] = f"{self.counts['failed']} pages failed"
+        elif self.counts["summarized"] or self.counts["unchanged"]:
+            result["status"] = "ok"
+        else:
+            result["status"] = "empty"
+        return result
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _summarize_page(self, page_id, title, document, digest, previous_summary_id, user_instruction):
+        """
+        Summarizes one page and saves it as its own summary page. Returns the new summary page id, or None.
+        """
+        self.logger.info(f"Summarizing: {title}")
+        # Same path as a report: one-shot if it fits, map-reduce for very long pages
+        with metrics.stage("summarize"):
+            summary = self.summarizer.summarize_documents([document], user_instruction=user_instruction)
+        if not summary or summary.startswith("Failed to generate"):
+            self.logger.error(f"Failed to summarize '{title}': {summary}")
+            self._count("failed")
+            return None
+
+        with metrics.stage("upload"):
+            new_page = self.notion.create_summary_page(page_id, title, summary)
+        if not new_page:
+            self.logger.error(f"Failed to save the summary of '{title}'.")
+            self._count("failed")
+            return None
+
+        self.index.put(page_id, digest, new_page["id"])
+        if previous_summary_id:
+            # The page changed: the old summary is replaced, not duplicated
+            try:
+                archived = self.notion.archive_page(previous_summary_id)
+            except (NotionAPIError, requests.exceptions.RequestException) as e:
+                self.logger.warning(f"Could not archive page {previous_summary_id}: {e}")
+                archived = False
+            if not archived:
+                # The new summary is saved either way; only the old one is left behind
+                self.logger.warning(f"The previous summary of '{title}' is still in Notion; archive it by hand.")
+        self._count("summarized")
+        return new_page["id"]
+
+    def close(self):
+        self.index.close()
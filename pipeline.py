@@ -0,0 +1,209 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from corpus import format_document
+from metrics import metrics
+from summarizer import SummarizationError
+
+# End-of-stream marker passed between stages
+_DONE = object()
+
+
+class ReportPipeline:
+    """
+    Pipelined report: fetch -> extract -> summarize chunks -> reduce -> upload.
+    Fetching and extraction run in their own threads, connected by bounded queues, and chunk
+    summaries start as soon as enough pages are extracted. When Gemini falls behind the queues
+    fill up and the Notion side waits (backpressure), so memory stays bounded.
+    """
+    def __init__(self, notion, summarizer, queue_size=32, token_budget=None):
+        self.notion = notion
+        self.summarizer = summarizer
+        self.queue_size = queue_size
+        # Same semantics as token_budget.apply_budget: whole pages are kept while they fit
+        self.token_budget = token_budget
+        self.logger = logging.getLogger(__name__)
+
+        self._stop = threading.Event()
+        self._errors = []
+        self.seen_page_ids = []
+        self.page_count = 0
+        self.skipped_pages = 0
+        self.summarized_documents = 0
+
+    def run(self, user_instruction, report_title):
+        """
+        Runs the pipeline and returns a result dict like main.run_report.
+        """
+        result = {"status": "failed", "pages": 0, "report_page_id": None, "error": None}
+        page_queue = queue.Queue(maxsize=self.queue_size)
+        doc_queue = queue.Queue(maxsize=self.queue_size)
+
+        stages = [
+            threading.Thread(target=self._guard, args=(self._fetch_stage, page_queue), name="pipeline-fetch", daemon=True),
+            threading.Thread(target=self._guard, args=(self._extract_stage, page_queue, doc_queue), name="pipeline-extract", daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            with metrics.stage("pipeline_summarize"):
+                summary = self._summarize_stage(doc_queue, user_instruction)
+        except SummarizationError as e:
+            self._errors.append(e)
+            summary = None
+        finally:
+            self._stop.set()
+            for stage in stages:
+                stage.join()
+
+        result["pages"] = self.page_count
+        if not self._errors and self.summarized_documents != self.page_count - self.skipped_pages:
+            # Every extracted document must reach the summarizer; a report missing pages is a failure
+            self._errors.append(RuntimeError(
+                f"{self.page_count - self.skipped_pages - self.summarized_documents} documents were lost between stages"))
+        if self._errors:
+            self.logger.error(f"Pipeline failed: {self._errors[0]}")
+            result["error"] = str(self._errors[0])
+            return result
+
+        self.logger.info(f"Found {self.page_count} pages in the database.")
+        if self.notion.cache:
+            self.logger.info(f"Page cache: {self.notion.cache.hits} hits, {self.notion.cache.misses} re-fetched.")
+            if self.notion.listing_complete:
+                # The listing is complete, so anything else in the cache was deleted in Notion
+                self.notion.cache.evict_missing(self.seen_page_ids)
+        if self.skipped_pages:
+            self.logger.info(f"Token budget skipped {self.skipped_pages} pages.")
+        if summary is None:
+            self.logger.info("No pages found to process.")
+            result["status"] = "empty"
+            return result
+
+        self.logger.info(f"Saving report to Notion as '{report_title}'...")
+        with metrics.stage("upload"):
+            new_page = self.notion.create_summary_page("Aggregate", report_title, summary)
+        if new_page:
+            self.logger.info("Successfully created report page in Notion! 🎉")
+            result["status"] = "ok"
+            result["report_page_id"] = new_page.get("id")
+        else:
+            self.logger.error("Failed to create report page.")
+            result["error"] = "Failed to create report page"
+        return result
+
+    def _guard(self, stage, *queues):
+        """
+        Runs a stage thread; on error records it and stops the other stages.
+        The output queue receives _DONE once the consumer has taken everything before it.
+        """
+        try:
+            # Stage threads overlap, so their times add up to more than the wall time
+            with metrics.stage(f"pipeline{stage.__name__.replace('_stage', '')}"):
+                stage(*queues)
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            self._put(queues[-1], _DONE)
+
+    def _put(self, q, item):
+        """
+        Blocking put (backpressure) that only gives up once the pipeline is stopping;
+        queued items are never dropped.
+        """
+        while True:
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                if self._stop.is_set():
+                    # The consumer stops draining on _stop as well, so no end marker is needed
+                    return False
+
+    def _drain(self, q):
+        """
+        Yields items from a queue until _DONE (or until the pipeline stops).
+        """
+        while True:
+            try:
+                item = q.get(timeout=0.2)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _count_documents(self, documents):
+        for document in documents:
+            self.summarized_documents += 1
+            yield document
+
+    def _fetch_stage(self, page_queue):
+        for page in self.notion.iter_unsummarized_pages():
+            if not self._put(page_queue, page):
+                return
+
+    def _extract_stage(self, page_queue, doc_queue):
+        used_tokens = 0
+        for page, page_content in self.notion.iter_page_text_contents(self._drain(page_queue)):
+            self.page_count += 1
+            self.seen_page_ids.append(page["id"])
+            title, props_text = self.notion.extract_page_properties(page)
+            self.logger.info(f"[{self.page_count}] Reading: {title}")
+
+            document = format_document(title, props_text, page_content)
+            if self.token_budget:
+                tokens = self.summarizer.estimator.estimate(document)
+                if used_tokens + tokens > self.token_budget:
+                    self.skipped_pages += 1
+                    continue
+                used_tokens += tokens
+            if not self._put(doc_queue, document):
+                return
+
+    def _summarize_stage(self, doc_queue, user_instruction):
+        """
+        Submits each chunk for summarization as soon as it is complete (at most max_workers in flight),
+        then reduces. A lone chunk is summarized with the one-shot prompt instead.
+        Returns the summary, or None if there was nothing to summarize.
+        """
+        in_flight = threading.BoundedSemaphore(self.summarizer.max_workers)
+        futures = []
+        first_chunk = None
+
+        with ThreadPoolExecutor(max_workers=self.summarizer.max_workers) as executor:
+            def submit(chunk):
+                # Blocks when max_workers chunks are being summarized: backpressure on extraction
+                in_flight.acquire()
+                future = executor.submit(self.summarizer.summarize_chunk, chunk, user_instruction)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+
+            for chunk in self.summarizer.iter_chunks(self._count_documents(self._drain(doc_queue))):
+                if self._stop.is_set():
+                    break
+                # Hold the first chunk back until a second one shows up (one chunk -> one-shot prompt)
+                if first_chunk is None and not futures:
+                    first_chunk = chunk
+                    continue
+                if first_chunk is not None:
+                    self.logger.info("Map phase started while pages are still being read...")
+                    submit(first_chunk)
+                    first_chunk = None
+                submit(chunk)
+
+            if self._errors:
+                return None
+            if first_chunk is not None:
+                return self.summarizer.summarize_single(first_chunk, user_instruction)
+            if not futures:
+                return None
+            self.logger.info(f"Map phase: waiting for {len(futures)} chunk summaries...")
+            partials = [future.result() for future in futures]
+
+        return self.summarizer.reduce_partials(partials, user_instruction)
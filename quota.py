@@ -0,0 +1,273 @@
+import logging
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import metrics
+
+# Gemini quotas are per minute
+WINDOW_SECONDS = 60.0
+
+
+def is_quota_error(error):
+    text = str(error)
+    return "429" in text or "quota" in text.lower() or "RESOURCE_EXHAUSTED" in text
+
+
+def retry_delay(error):
+    """
+    Delay suggested by a 429 ("retryDelay": "17s" / "Please retry in 17.3s"), or None.
+    """
+    match = re.search(r"retry(?:Delay)?[\"']?\s*[:=]?\s*[\"']?(?:in\s+|after\s+)?(\d+(?:\.\d+)?)\s*s", str(error), re.I)
+    return float(match.group(1)) if match else None
+
+
+def parse_limits(spec):
+    """
+    'model=RPM[/TPM],model=RPM[/TPM]' -> {model: (rpm, tpm)}; 0 or a missing TPM means no limit.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        limits[model.strip()] = (int(rpm) if rpm.strip() else None, int(tpm) if tpm.strip() else None)
+    return limits
+
+
+class Lane:
+    """
+    One model on one API key: its own sliding window of requests/tokens and its own cooldown.
+    """
+    def __init__(self, model, client, key_index=0, rpm=None, tpm=None, window=WINDOW_SECONDS):
+        self.model = model
+        self.client = client
+        self.label = f"{model}" if key_index == 0 else f"{model} (key {key_index + 1})"
+        self.rpm = rpm or None
+        self.tpm = tpm or None
+        self.window = window
+        self.requests = deque() # [started, tokens] within the window
+        self.cooldown_until = 0.0
+        self.backoff = 0.0
+        self.in_flight = 0
+
+    def available_at(self, now, tokens):
+        """
+        Earliest time this lane can take a request of `tokens` (now if it has capacity).
+        """
+        while self.requests and self.requests[0][0] <= now - self.window:
+            self.requests.popleft()
+        at = max(now, self.cooldown_until)
+        if self.rpm and len(self.requests) >= self.rpm:
+            at = max(at, self.requests[len(self.requests) - self.rpm][0] + self.window)
+        if self.tpm and self.requests:
+            excess = sum(entry[1] for entry in self.requests) + tokens - self.tpm
+            # A request larger than the whole budget goes alone, once the window is empty
+            for started, used in self.requests:
+                if excess <= 0:
+                    break
+                excess -= used
+                at = max(at, started + self.window)
+        return at
+
+
+class QuotaScheduler:
+    """
+    Routes Gemini calls over lanes (model x API key) listed in preference order.
+    Each call goes to the most preferred model with a lane that has capacity in its sliding
+    RPM/TPM window; a 429 only cools that lane down (server-suggested delay, else exponential
+    backoff), so traffic moves to the next model/key and returns to the preferred one as soon as
+    its quota resets. When no lane has capacity the call waits for the earliest one, not a fixed
+    minute. Calls slower than the hedge threshold (counted from when the call starts running, and
+    scaled up for prompts larger than usual) are duplicated on another lane (first answer wins).
+    """
+    def __init__(self, lanes, hedge_after=None, max_attempts=None, min_backoff=2.0, max_backoff=60.0,
+                 clock=time.monotonic):
+        """
+        hedge_after: seconds before a slow call of typical size is hedged; None adapts it to 3x the
+        median latency (at least 5s, after 5 calls); 0 disables hedging. Either way it grows in
+        proportion for prompts larger than the median one.
+        max_attempts: quota errors tolerated per call (default: 3 per lane).
+        """
+        self.lanes = lanes
+        self.models = list(dict.fromkeys(lane.model for lane in lanes))
+        self.preferred = self.models[0]
+        self.hedge_after = hedge_after
+        self.max_attempts = max_attempts or 3 * len(lanes)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self._cond = threading.Condition()
+        self._latencies = deque(maxlen=50)
+        self._prompt_tokens = deque(maxlen=50)
+        self._routed = self.preferred
+        self._executor = None
+
+    @classmethod
+    def for_models(cls, models, clients, limits=None, window=WINDOW_SECONDS, **kwargs):
+        """
+        Lanes for every model (in preference order) on every client (one per API key).
+        limits: {model: (rpm, tpm)}; models without an entry are only limited by their 429s.
+        """
+        limits = limits or {}
+        lanes = [
+            Lane(model, client, key_index, *limits.get(model, (None, None)), window=window)
+            for model in models
+            for key_index, client in enumerate(clients)
+        ]
+        return cls(lanes, **kwargs)
+
+    def acquire(self, tokens, exclude=(), block=True):
+        """
+        Reserves capacity for one request on the best lane; waits until one has capacity (unless
+        block=False). Returns (lane, entry) or None if no lane can be used.
+        """
+        waited = 0.0
+        with self._cond:
+            while True:
+                now = self.clock()
+                usable = [lane for lane in self.lanes if lane not in exclude]
+                if not usable:
+                    return None
+                ready_at = {lane: lane.available_at(now, tokens) for lane in usable}
+                for model in self.models:
+                    ready = [lane for lane in usable if lane.model == model and ready_at[lane] <= now]
+                    if ready:
+                        # Spread over the keys of the same model
+                        lane = min(ready, key=lambda l: (len(l.requests), l.in_flight))
+                        entry = [now, tokens]
+                        lane.requests.append(entry)
+                        lane.in_flight += 1
+                        if not exclude:
+                            # Hedges don't change where the traffic goes
+                            self._log_route(lane)
+                        if waited:
+                            metrics.add_time("gemini.quota_wait", waited)
+                        return lane, entry
+                if not block:
+                    return None
+                delay = min(ready_at.values()) - now
+                started = self.clock()
+                self._cond.wait(timeout=max(delay, 0.01))
+                waited += self.clock() - started
+
+    def release(self, lane, entry, error=None, tokens=None, latency=None):
+        """
+        Settles a request: actual token usage on success, a cooldown on a quota error.
+        """
+        with self._cond:
+            lane.in_flight -= 1
+            if error is None:
+                if latency is not None:
+                    # Estimated prompt size (before it is replaced by the actual usage)
+                    self._latencies.append(latency)
+                    self._prompt_tokens.append(entry[1])
+                if tokens:
+                    entry[1] = tokens
+                lane.backoff = 0.0
+            elif is_quota_error(error):
+                metrics.count("gemini.429")
+                delay = retry_delay(error)
+                if delay is None:
+                    lane.backoff = min(self.max_backoff, lane.backoff * 2 or self.min_backoff)
+                    delay = lane.backoff
+                lane.cooldown_until = max(lane.cooldown_until, self.clock() + delay)
+                self.logger.warning(f"⚠️ Gemini quota exceeded on {lane.label}; resting it for {delay:.1f}s.")
+            self._cond.notify_all()
+
+    def _log_route(self, lane):
+        if lane.model == self._routed:
+            return
+        if lane.model == self.preferred:
+            self.logger.info(f"Quota of {self.preferred} has reset, routing back to it.")
+        else:
+            self.logger.info(f"{self._routed} has no capacity, routing requests to {lane.model}...")
+        self._routed = lane.model
+
+    def hedge_threshold(self, tokens=None):
+        """
+        Seconds a call of `tokens` prompt tokens may run before it is hedged (None: never).
+        A large prompt is expected to be slow, so its threshold is scaled by its size.
+        """
+        if self.hedge_after == 0:
+            return None
+        with self._cond:
+            if self.hedge_after is not None:
+                threshold = self.hedge_after
+            elif len(self._latencies) < 5:
+                return None
+            else:
+                threshold = max(5.0, 3 * statistics.median(self._latencies))
+            typical = statistics.median(self._prompt_tokens) if self._prompt_tokens else None
+        if tokens and typical:
+            threshold *= max(1.0, tokens / typical)
+        return threshold
+
+    def call(self, request, tokens, used_tokens=None):
+        """
+        Runs request(lane) on the best lane and returns (lane, result). Quota errors move the call
+        to another lane (or wait for the earliest to recover), up to max_attempts; other errors are
+        raised. used_tokens(result) reports actual usage for the TPM window.
+        """
+        executor = self._get_executor()
+        last_error = None
+        for attempt in range(self.max_attempts):
+            reservation = self.acquire(tokens)
+            running = threading.Event()
+            futures = {executor.submit(self._run, request, used_tokens, *reservation, running): reservation[0]}
+            threshold = self.hedge_threshold(tokens)
+            if threshold is not None:
+                # Time spent queued behind other calls doesn't count towards the threshold
+                running.wait()
+                done, _ = wait(futures, timeout=threshold)
+                hedge = None if done else self.acquire(tokens, exclude={reservation[0]}, block=False)
+                if hedge is not None:
+                    # Slow call: duplicate it on another lane with capacity right now
+                    self.logger.info(f"Gemini call on {reservation[0].label} is slow, hedging on {hedge[0].label}...")
+                    metrics.count("gemini.hedged")
+                    futures[executor.submit(self._run, request, used_tokens, *hedge)] = hedge[0]
+
+            errors = []
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if futures[future] is not reservation[0]:
+                            metrics.count("gemini.hedge_wins")
+                        return futures[future], future.result()
+                    errors.append(future.exception())
+            fatal = [e for e in errors if not is_quota_error(e)]
+            if fatal:
+                raise fatal[0]
+            last_error = errors[-1]
+            self.logger.warning(f"Gemini quota exceeded (attempt {attempt + 1}/{self.max_attempts}), rerouting...")
+        raise last_error
+
+    def _run(self, request, used_tokens, lane, entry, running=None):
+        if running is not None:
+            running.set()
+        started = time.perf_counter()
+        try:
+            result = request(lane)
+        except Exception as e:
+            self.release(lane, entry, error=e)
+            raise
+        self.release(lane, entry, tokens=used_tokens(result) if used_tokens else None,
+                     latency=time.perf_counter() - started)
+        return result
+
+    def _get_executor(self):
+        with self._cond:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="gemini")
+            return self._executor
+
+    def close(self):
+        # Losing hedges may still be running; they finish in the background
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
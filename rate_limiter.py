@@ -0,0 +1,79 @@
+import random
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiter.
+    Defaults match Notion's documented limit (~3 requests/second on average, short bursts allowed).
+    """
+    def __init__(self, rate=3.0, burst=5):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Holds back every caller for the given time (e.g. a 429 with Retry-After)
+        and drops the saved-up burst so traffic resumes at the average rate.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0
+            self.updated = max(now, self.paused_until)
+
+
+_shared_buckets = {}
+_shared_lock = threading.Lock()
+
+def shared_bucket(key, rate=3.0, burst=5):
+    """
+    Returns the process-wide bucket for a key (e.g. an integration token),
+    so every connector using the same token shares one budget.
+    """
+    with _shared_lock:
+        if key not in _shared_buckets:
+            _shared_buckets[key] = TokenBucket(rate=rate, burst=burst)
+        return _shared_buckets[key]
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """
+    Exponential backoff with full jitter: a random delay in [0, min(cap, base * 2^attempt)].
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header given in seconds. Returns None if missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,233 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from cache import content_hash, default_cache_path
+from metrics import metrics
+
+_WORD_RE = re.compile(r"[가-힣]+|[a-z0-9]+")
+
+# Particles (josa) stripped from the end of Hangul words, longest first
+_JOSA = sorted([
+    "은", "는", "이", "가", "을", "를", "에", "의", "로", "으로", "에서", "와", "과", "도", "만",
+    "까지", "부터", "에게", "한테", "처럼", "보다", "이나", "나", "랑", "이랑", "께서", "에는", "에서는",
+    "으로는", "로는", "과의", "와의", "들", "들은", "들을", "들의",
+], key=len, reverse=True)
+
+# Words that describe the request rather than the topic ("...만 뽑아서 정리해줘")
+_QUERY_STOPWORDS = {
+    "요약", "정리", "분석", "작성", "해줘", "해주세요", "줘", "주세요", "써줘", "알려줘", "뽑아", "뽑아서",
+    "아서", "어서", "해서", "해", "하고", "만들어", "만들어줘", "찾아", "찾아줘", "보고서", "내용", "관련",
+    "모든", "모두", "전부", "전체", "것", "거", "좀", "그리고", "대해", "대한", "대해서",
+    "the", "and", "for", "with", "about", "please", "summarize", "summary", "list", "all",
+}
+
+# Request verb endings stripped from instruction words ("정리해줘" -> "정리")
+_REQUEST_ENDINGS = sorted(["해줘", "해주세요", "해주라", "줘", "주세요", "해서", "하고", "하기", "해"], key=len, reverse=True)
+
+
+def _strip_josa(word):
+    for josa in _JOSA:
+        if len(word) > len(josa) + 1 and word.endswith(josa):
+            return word[:-len(josa)]
+    return word
+
+
+def tokenize(text, query=False):
+    """
+    Korean-aware tokens: Hangul words without their particles plus their character bigrams
+    (matches compounds and inflected forms: '회의록' ~ '회의'), and lowercase latin/digit words.
+    query: also drop request words/endings of an instruction ("...만 뽑아서 정리해줘").
+    """
+    stopwords = _QUERY_STOPWORDS if query else ()
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if "가" <= word[0] <= "힣":
+            stem = _strip_josa(word)
+            if query:
+                for ending in _REQUEST_ENDINGS:
+                    if len(stem) > len(ending) and stem.endswith(ending):
+                        stem = stem[:-len(ending)]
+                        break
+            grams = [stem] + ([stem[i:i + 2] for i in range(len(stem) - 1)] if len(stem) > 2 else [])
+            tokens.extend(g for g in grams if g not in stopwords)
+        elif len(word) > 1 and word not in stopwords:
+            tokens.append(word)
+    return tokens
+
+
+class RelevanceIndex:
+    """
+    BM25 index over page documents, persisted per source (SQLite) and updated incrementally:
+    only pages whose document changed since the last run are re-tokenized.
+    Scoring runs over the whole sparse term matrix at once (NumPy), not page by page.
+    """
+    def __init__(self, source_id, path=None, k1=1.5, b=0.75):
+        self.source_id = source_id
+        # ":memory:" keeps nothing between runs (--no-cache)
+        self.path = path or default_cache_path("relevance.db")
+        self.k1 = k1
+        self.b = b
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS terms (
+                source_id TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                terms TEXT NOT NULL,
+                updated_at REAL,
+                PRIMARY KEY (source_id, page_id)
+            )
+        """)
+        self.conn.commit()
+        # page id -> (content hash, {term: count})
+        self.docs = {
+            page_id: (digest, None)
+            for page_id, digest in self.conn.execute(
+                "SELECT page_id, content_hash FROM terms WHERE source_id = ?", (source_id,))
+        }
+        self.reindexed = 0
+
+    def update(self, documents):
+        """
+        Indexes [(page_id, text)]; unchanged pages (same content hash) are loaded, not re-tokenized.
+        """
+        changed = []
+        stale_ids = []
+        for page_id, text in documents:
+            digest = content_hash(text)
+            stored = self.docs.get(page_id)
+            if stored and stored[0] == digest:
+                if stored[1] is None:
+                    stale_ids.append(page_id)
+                continue
+            counts = Counter(tokenize(text))
+            self.docs[page_id] = (digest, counts)
+            changed.append((self.source_id, page_id, digest, json.dumps(counts, ensure_ascii=False), time.time()))
+
+        with self.lock:
+            for page_id in stale_ids:
+                row = self.conn.execute("SELECT terms FROM terms WHERE source_id = ? AND page_id = ?",
+                                        (self.source_id, page_id)).fetchone()
+                self.docs[page_id] = (self.docs[page_id][0], Counter(json.loads(row[0])))
+            if changed:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO terms (source_id, page_id, content_hash, terms, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)", changed)
+                self.conn.commit()
+        self.reindexed += len(changed)
+        metrics.count("relevance.reindexed", len(changed))
+        return len(changed)
+
+    def scores(self, query, page_ids):
+        """
+        BM25 score of every page in page_ids (indexed with update) against the query, as an array.
+        """
+        query_terms = set(tokenize(query, query=True))
+        n = len(page_ids)
+        if not query_terms or n == 0:
+            return np.zeros(n)
+
+        # Sparse document-term matrix as COO arrays: (doc, term, count) per stored term
+        vocabulary = {}
+        doc_idx, term_idx, counts = [], [], []
+        for i, page_id in enumerate(page_ids):
+            for term, count in self.docs[page_id][1].items():
+                doc_idx.append(i)
+                term_idx.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+        query_ids = [vocabulary[t] for t in query_terms if t in vocabulary]
+        if not query_ids:
+            return np.zeros(n)
+        doc_idx = np.asarray(doc_idx, dtype=np.int64)
+        term_idx = np.asarray(term_idx, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.float64)
+
+        lengths = np.bincount(doc_idx, weights=counts, minlength=n)
+        avg_length = lengths.mean() or 1.0
+        df = np.bincount(term_idx, minlength=len(vocabulary))
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+        mask = np.isin(term_idx, query_ids)
+        tf = counts[mask]
+        docs = doc_idx[mask]
+        norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / avg_length)
+        contributions = idf[term_idx[mask]] * tf * (self.k1 + 1.0) / (tf + norm)
+        return np.bincount(docs, weights=contributions, minlength=n)
+
+    def evict_missing(self, seen_page_ids):
+        """
+        Drops pages of this source that are no longer in the corpus.
+        """
+        seen = set(seen_page_ids)
+        missing = [page_id for page_id in self.docs if page_id not in seen]
+        with self.lock:
+            self.conn.executemany("DELETE FROM terms WHERE source_id = ? AND page_id = ?",
+                                  [(self.source_id, page_id) for page_id in missing])
+            self.conn.commit()
+        for page_id in missing:
+            del self.docs[page_id]
+        return len(missing)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def select_relevant(scores, top_k=None, threshold=None):
+    """
+    Indexes of the pages to keep, in their original order: the top_k best and/or those scoring at
+    least threshold x the best score; pages sharing no term with the query are dropped.
+    Everything is kept when nothing matches the query.
+    """
+    n = len(scores)
+    if n == 0 or scores.max() <= 0:
+        return list(range(n))
+    keep = scores > 0
+    if threshold is not None:
+        keep &= scores >= threshold * scores.max()
+    if top_k is not None and top_k < n:
+        # Stable: ties keep the earlier page
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        top = np.zeros(n, dtype=bool)
+        top[best] = True
+        keep &= top
+    return np.flatnonzero(keep).tolist()
+
+
+def filter_corpus(corpus, source_id, user_instruction, top_k=None, threshold=None, persist=True):
+    """
+    Relevance pre-filter: ranks the corpus documents against the instruction and returns a
+    CorpusSubset with only the relevant pages (the original corpus if all of them are kept).
+    """
+    logger = logging.getLogger(__name__)
+    index = RelevanceIndex(source_id, path=None if persist else ":memory:")
+    try:
+        # Page ids may be missing (e.g. synthetic documents): fall back to the position
+        keys = [page_id or f"#{i}" for i, page_id in enumerate(corpus.page_ids)]
+        # Titles count twice: a match in the title says more than one in the body
+        index.update((key, f"{corpus.titles[i]}\n{corpus.get(i)}") for i, key in enumerate(keys))
+        scores = index.scores(user_instruction, keys)
+        kept = select_relevant(scores, top_k=top_k, threshold=threshold)
+        if persist:
+            index.evict_missing(keys)
+    finally:
+        index.close()
+
+    metrics.count("relevance.pages_kept", len(kept))
+    metrics.count("relevance.pages_dropped", len(corpus) - len(kept))
+    if scores.max() <= 0:
+        logger.warning("No page matches the instruction's keywords; relevance filter keeps every page.")
+        return corpus
+    logger.info(f"Relevance filter keeps {len(kept)}/{len(corpus)} pages "
+                f"({index.reindexed} re-indexed); best matches: "
+                + ", ".join(f"{corpus.titles[i]} ({scores[i]:.1f})" for i in np.argsort(-scores, kind="stable")[:3] if scores[i] > 0))
+    return corpus if len(kept) == len(corpus) else corpus.subset(kept)
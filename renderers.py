@@ -0,0 +1,250 @@
+# Table-driven renderers for Notion property values and blocks.
+# Property extractors are compiled once per database schema (GET /databases/{id}), so rendering a
+# row is a single pass over a precomputed list instead of an if/elif chain per property.
+
+
+def plain_text(rich_text):
+    return "".join(t.get("plain_text", "") for t in rich_text or [])
+
+
+def _name(value):
+    return (value or {}).get("name", "")
+
+
+def _date(value):
+    if not value:
+        return ""
+    start, end = value.get("start", ""), value.get("end")
+    return f"{start} ~ {end}" if end else start
+
+
+def _number(value):
+    if value is None:
+        return ""
+    # 3.0 -> "3"
+    return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+
+
+def _user(value):
+    value = value or {}
+    return value.get("name") or value.get("person", {}).get("email") or value.get("id", "")
+
+
+def _formula(value):
+    """
+    Formula results carry their own type: string, number, boolean or date.
+    """
+    if not value:
+        return ""
+    f_type = value.get("type")
+    result = value.get(f_type)
+    if f_type == "boolean":
+        return "Yes" if result else "No"
+    if f_type == "date":
+        return _date(result)
+    if f_type == "number":
+        return _number(result)
+    return result or ""
+
+
+def _rollup(value):
+    """
+    Rollups are a number, a date or an array of property values (rendered with the same table).
+    """
+    if not value:
+        return ""
+    r_type = value.get("type")
+    if r_type == "number":
+        return _number(value.get("number"))
+    if r_type == "date":
+        return _date(value.get("date"))
+    if r_type == "array":
+        parts = (render_property_value(item) for item in value.get("array", []))
+        return ", ".join(p for p in parts if p)
+    return ""
+
+
+def _files(value):
+    return ", ".join(f.get("name", "") for f in value or [])
+
+
+def _unique_id(value):
+    if not value or value.get("number") is None:
+        return ""
+    prefix = value.get("prefix")
+    return f"{prefix}-{value['number']}" if prefix else str(value["number"])
+
+
+# Property type -> renderer of the type-specific value (page["properties"][name][type])
+PROPERTY_RENDERERS = {
+    "title": plain_text,
+    "rich_text": plain_text,
+    "number": _number,
+    "select": _name,
+    "multi_select": lambda values: ", ".join(_name(v) for v in values or []),
+    "status": _name,
+    "date": _date,
+    "url": lambda value: value or "",
+    "email": lambda value: value or "",
+    "phone_number": lambda value: value or "",
+    "checkbox": lambda value: "Yes" if value else "No",
+    "people": lambda values: ", ".join(_user(v) for v in values or []),
+    "relation": lambda values: ", ".join(v.get("id", "") for v in values or []),
+    "formula": _formula,
+    "rollup": _rollup,
+    "files": _files,
+    "created_time": lambda value: value or "",
+    "last_edited_time": lambda value: value or "",
+    "created_by": _user,
+    "last_edited_by": _user,
+    "unique_id": _unique_id,
+}
+
+
+def render_property_value(prop_val):
+    """
+    Renders one property value object ({"type": ..., <type>: ...}); "" for unknown types.
+    """
+    p_type = prop_val.get("type")
+    renderer = PROPERTY_RENDERERS.get(p_type)
+    return renderer(prop_val.get(p_type)) if renderer else ""
+
+
+class PropertyExtractor:
+    """
+    Turns a page into (title, '- Name: value' lines).
+    With a database schema the title property and the (name, type, renderer) list are resolved once;
+    without one (pages outside a database) each value is dispatched on its own type.
+    """
+    def __init__(self, schema=None):
+        self.schema = schema
+        self.title_property = None
+        self.fields = None
+        if schema is not None:
+            self.fields = []
+            for name, prop in schema.items():
+                p_type = prop.get("type")
+                if p_type == "title":
+                    self.title_property = name
+                elif p_type in PROPERTY_RENDERERS:
+                    self.fields.append((name, p_type, PROPERTY_RENDERERS[p_type]))
+
+    def __call__(self, page, default_title="Untitled"):
+        properties = page.get("properties", {})
+        if self.fields is None:
+            return self._extract_generic(properties, default_title)
+
+        title_prop = properties.get(self.title_property)
+        if title_prop is None or title_prop.get("type") != "title":
+            # Schema is stale (e.g. renamed property): fall back to per-value dispatch
+            return self._extract_generic(properties, default_title)
+        title = plain_text(title_prop.get("title")) or default_title
+
+        lines = []
+        for name, p_type, renderer in self.fields:
+            prop_val = properties.get(name)
+            if prop_val is None:
+                continue
+            # A type change since the schema was read is rendered by the value's actual type
+            content = renderer(prop_val.get(p_type)) if prop_val.get("type") == p_type else render_property_value(prop_val)
+            if content:
+                lines.append(f"- {name}: {content}\n")
+        return title, "".join(lines)
+
+    @staticmethod
+    def _extract_generic(properties, default_title):
+        title = default_title
+        lines = []
+        for name, prop_val in properties.items():
+            if prop_val.get("type") == "title":
+                title = plain_text(prop_val.get("title")) or default_title
+                continue
+            content = render_property_value(prop_val)
+            if content:
+                lines.append(f"- {name}: {content}\n")
+        return title, "".join(lines)
+
+
+def _prefixed(prefix):
+    return lambda block, obj, text: f"{prefix}{text}" if text else ""
+
+
+def _to_do(block, obj, text):
+    if not text:
+        return ""
+    return f"- [{'x' if obj.get('checked') else ' '}] {text}"
+
+
+def _code(block, obj, text):
+    if not text:
+        return ""
+    return f"```{obj.get('language', '')}\n{text}\n```"
+
+
+def _link(block, obj, text):
+    """
+    bookmark / embed / link_preview: the URL plus the caption if there is one.
+    """
+    url = obj.get("url", "")
+    caption = plain_text(obj.get("caption"))
+    if not url:
+        return caption
+    return f"[{caption}]({url})" if caption else url
+
+
+def _caption(block, obj, text):
+    caption = plain_text(obj.get("caption"))
+    return f"({block.get('type')}: {caption})" if caption else ""
+
+
+def _table_row(block, obj, text):
+    cells = [plain_text(cell).replace("|", "\\|") for cell in obj.get("cells", [])]
+    return "| " + " | ".join(cells) + " |" if any(cells) else ""
+
+
+def _equation(block, obj, text):
+    expression = obj.get("expression", "")
+    return f"$${expression}$$" if expression else ""
+
+
+# Version of the text produced by the block renderers (and the page text around them). Stored with
+# every cached page: bump it whenever a renderer is added or its output changes, so pages cached
+# with the old output are re-read instead of served as they were.
+RENDER_VERSION = 2
+
+# Block type -> renderer(block, type object, plain text of its rich_text). Types not listed
+# (columns, tables, synced blocks...) render nothing themselves; their children are still rendered.
+BLOCK_RENDERERS = {
+    "paragraph": lambda block, obj, text: text,
+    "toggle": lambda block, obj, text: text,
+    "heading_1": _prefixed("# "),
+    "heading_2": _prefixed("## "),
+    "heading_3": _prefixed("### "),
+    "bulleted_list_item": _prefixed("- "),
+    "numbered_list_item": _prefixed("1. "),
+    "to_do": _to_do,
+    "quote": _prefixed("> "),
+    "callout": _prefixed("> 💡 "), # Distinguish callout
+    "code": _code,
+    "bookmark": _link,
+    "embed": _link,
+    "link_preview": _link,
+    "table_row": _table_row,
+    "equation": _equation,
+    "image": _caption,
+    "video": _caption,
+    "file": _caption,
+    "pdf": _caption,
+}
+
+
+def render_block(block):
+    """
+    Converts a single block to a line of markdown-ish text ("" if it has no text).
+    """
+    b_type = block.get("type")
+    renderer = BLOCK_RENDERERS.get(b_type)
+    if renderer is None:
+        return ""
+    obj = block.get(b_type) or {}
+    return renderer(block, obj, plain_text(obj.get("rich_text")))
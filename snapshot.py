@@ -0,0 +1,300 @@
+# Workspace snapshots: every fetched page (properties, timestamps) with its rendered text in one file,
+# so prompts can be iterated on against a frozen corpus without touching Notion.
+# Layout: MAGIC | record | record | ... | index | footer
+#   record = zlib-compressed JSON {"page": <page object>, "text": <rendered text>}
+#   index  = zlib-compressed JSON {"meta": {...}, "pages": [[page_id, offset, length], ...]}
+#   footer = index offset (8 bytes, big endian) + index length (8 bytes) + MAGIC
+# Records are compressed one by one, so any page is read with one seek and one decompress.
+import argparse
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from datetime import datetime, timezone
+
+from notion_connector import normalize_id, parse_time
+from renderers import PropertyExtractor
+
+MAGIC = b"NSNAP001"
+FOOTER = struct.Struct(">QQ8s")
+
+
+class SnapshotError(Exception):
+    """Raised when a file is not a readable snapshot."""
+
+
+class SnapshotWriter:
+    """
+    Appends pages to a snapshot as they are fetched (thread-safe).
+    The file is written to PATH.tmp and moved into place by close(), so a crashed run never
+    leaves a truncated snapshot behind. A page added twice keeps its latest record.
+    """
+    def __init__(self, path, source_id, source_type, schema=None):
+        self.path = path
+        self.meta = {
+            "source_id": source_id,
+            "source_type": source_type,
+            "schema": schema,
+            "created_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        }
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._index = {} # page id -> (offset, length), insertion order = page order
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(MAGIC)
+        self.raw_bytes = 0
+
+    def add(self, page, text):
+        payload = json.dumps({"page": page, "text": text}, ensure_ascii=False).encode("utf-8")
+        data = zlib.compress(payload, 6)
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(data)
+            self._index.pop(page["id"], None)
+            self._index[page["id"]] = (offset, len(data))
+            self.raw_bytes += len(payload)
+
+    def close(self):
+        """
+        Writes the index and footer and moves the snapshot into place. Returns the page count.
+        """
+        with self._lock:
+            if self._file is None:
+                return len(self._index)
+            self.meta["pages"] = len(self._index)
+            index = {"meta": self.meta, "pages": [[page_id, *entry] for page_id, entry in self._index.items()]}
+            data = zlib.compress(json.dumps(index, ensure_ascii=False).encode("utf-8"), 6)
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.write(FOOTER.pack(offset, len(data), MAGIC))
+            size = self._file.tell()
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.path)
+        self.logger.info(f"Snapshot written to {self.path}: {len(self._index)} pages, "
+                         f"{size:,} bytes ({self.raw_bytes:,} bytes uncompressed)")
+        return len(self._index)
+
+    def abort(self):
+        """
+        Drops the partial snapshot (a failed export leaves any previous snapshot untouched).
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                os.remove(self._tmp_path)
+
+
+class SnapshotReader:
+    """
+    Random access to a snapshot: only the index is loaded, records are read on demand.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "rb")
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise SnapshotError(f"{path} is not a snapshot")
+            self._file.seek(-FOOTER.size, os.SEEK_END)
+            offset, length, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is incomplete (no index)")
+            self._file.seek(offset)
+            index = json.loads(zlib.decompress(self._file.read(length)))
+        except (OSError, zlib.error, ValueError, struct.error) as e:
+            self._file.close()
+            raise SnapshotError(f"Could not read snapshot {path}: {e}") from e
+        except SnapshotError:
+            self._file.close()
+            raise
+        self.meta = index["meta"]
+        self._index = {page_id: (offset, length) for page_id, offset, length in index["pages"]}
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, page_id):
+        return page_id in self._index
+
+    @property
+    def page_ids(self):
+        return list(self._index)
+
+    def get(self, page_id):
+        """
+        (page, text) for one page id; KeyError if it is not in the snapshot.
+        """
+        offset, length = self._index[page_id]
+        with self._lock:
+            self._file.seek(offset)
+            data = self._file.read(length)
+        record = json.loads(zlib.decompress(data))
+        return record["page"], record["text"]
+
+    def iter_records(self):
+        """
+        Yields (page, text) in the order the pages were fetched.
+        """
+        for page_id in self._index:
+            yield self.get(page_id)
+
+    def close(self):
+        self._file.close()
+
+
+class SnapshotConnector:
+    """
+    Offline stand-in for NotionConnector that replays a snapshot: the same reading interface
+    (listing, text, properties) with no network calls. Summaries are written as local markdown
+    files instead of Notion pages, so every report mode works on a frozen corpus.
+    """
+    def __init__(self, path, output_dir="reports"):
+        self.reader = SnapshotReader(path)
+        meta = self.reader.meta
+        self.logger = logging.getLogger(__name__)
+        # Keyed apart from the live source: replayed summaries never touch the live summary index
+        self.source_id = f"snapshot:{meta['source_id']}"
+        self.source_type = meta["source_type"]
+        self.cache = None
+        self.output_dir = output_dir
+        self._source_database = normalize_id(meta["source_id"]) if meta["source_type"] == "database" else None
+        self._extractor = PropertyExtractor(meta.get("schema"))
+        self._generic_extractor = PropertyExtractor()
+        self.logger.info(f"Replaying snapshot {path}: {len(self.reader)} pages of {meta['source_type']} "
+                         f"{meta['source_id']} (taken {meta.get('created_at')})")
+
+    def fetch_unsummarized_pages(self, edited_after=None):
+        return list(self.iter_unsummarized_pages(edited_after))
+
+    def iter_unsummarized_pages(self, edited_after=None):
+        edited_after = parse_time(edited_after)
+        for page, _ in self.reader.iter_records():
+            if edited_after is None or (parse_time(page.get("last_edited_time")) or edited_after) >= edited_after:
+                yield page
+
+    def iter_page_text_contents(self, pages, batch_size=None):
+        for page in pages:
+            yield page, self.reader.get(page["id"])[1]
+
+    def get_page_text_content(self, page_id):
+        return self.reader.get(page_id)[1]
+
+    def get_pages_text_content(self, page_ids):
+        return {page_id: self.get_page_text_content(page_id) for page_id in page_ids}
+
+    def extract_page_properties(self, page):
+        parent_db = page.get("parent", {}).get("database_id")
+        extractor = self._extractor if parent_db and normalize_id(parent_db) == self._source_database \
+            else self._generic_extractor
+        return extractor(page)
+
+    def create_summary_page(self, original_page_id, original_title, summary_content):
+        """
+        Writes the summary to OUTPUT_DIR/[AI Summary] <title>.md; returns {"id": path}.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = re.sub(r'[\\/:*?"<>|]', "_", f"[AI Summary] {original_title}")
+        if original_page_id != "Aggregate":
+            # Per-page summaries: pages may share a title
+            name += f" ({original_page_id.replace('-', '')[:8]})"
+        path = os.path.join(self.output_dir, f"{name}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(summary_content)
+        self.logger.info(f"Summary written to {path}")
+        return {"id": path}
+
+    def _parse_markdown_to_blocks(self, text):
+        # Local "blocks" are markdown lines (used by SummaryPageStream)
+        return [line + "\n" for line in text.split("\n")]
+
+    def append_blocks(self, block_id, blocks):
+        with open(block_id, "a", encoding="utf-8") as f:
+            f.write("".join(blocks))
+        return True
+
+    def archive_page(self, page_id):
+        """
+        Removes a previously written local summary (replaced by a newer one).
+        """
+        try:
+            os.remove(page_id)
+            return True
+        except OSError:
+            return False
+
+    def close(self):
+        self.reader.close()
+
+
+def export_snapshot(notion, path, edited_after=None):
+    """
+    Fetches every unsummarized page of a live connector and writes it to a snapshot.
+    Returns the number of pages written.
+    """
+    writer = SnapshotWriter(path, notion.source_id, notion.source_type, getattr(notion, "database_schema", None))
+    try:
+        for page, text in notion.iter_page_text_contents(notion.iter_unsummarized_pages(edited_after=edited_after)):
+            writer.add(page, text)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Notion AI Assistant - workspace snapshots (replay with main.py --replay)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Fetch a database/page and write it to a snapshot")
+    export.add_argument("path", help="Snapshot file to write")
+    export.add_argument("--source-id", default=None, help="Database/page to export (defaults to NOTION_DATABASE_ID)")
+    export.add_argument("--since", default=None, help="Only pages edited on or after this ISO time")
+    export.add_argument("--refresh", action="store_true", help="Ignore the local caches")
+    export.add_argument("--no-cache", action="store_true", help="Don't read or write the local caches")
+    export.add_argument("--max-depth", type=int, default=None, help="Maximum block nesting depth to read")
+    export.add_argument("--max-nodes", type=int, default=None, help="Maximum block listings per page")
+    info = commands.add_parser("info", help="Show what a snapshot contains")
+    info.add_argument("path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)],
+        force=True
+    )
+    if args.command == "info":
+        reader = SnapshotReader(args.path)
+        try:
+            print(json.dumps({**reader.meta, "schema": sorted(reader.meta.get("schema") or {})}, ensure_ascii=False, indent=2))
+        finally:
+            reader.close()
+        return 0
+
+    from dotenv import load_dotenv
+    from cache import PageCache
+    from main import connector_options
+    from notion_connector import NotionConnector
+    load_dotenv()
+    notion = NotionConnector(source_id=args.source_id, **connector_options(args))
+    try:
+        if notion.source_type == "unknown":
+            return 1
+        if not args.no_cache:
+            notion.cache = PageCache(notion.source_id, refresh=args.refresh)
+        export_snapshot(notion, args.path, edited_after=args.since)
+    finally:
+        notion.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
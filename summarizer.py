@@ -1,77 +1,443 @@
 import os
 from google import genai
+import itertools
 import logging
+import threading
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import response_key
+from metrics import metrics
+from quota import QuotaScheduler, is_quota_error
+from token_budget import EXPECTED_OUTPUT_TOKENS, TokenEstimator, BudgetPlan, apply_budget, count_reduce_requests
+
+# Prompt templates. Kept as constants so the response cache can key on the template itself.
+INSTRUCTION_PROMPT = """
+            You are a helpful assistant maximizing the utility of the user's Notion database.
+
+            User's Instruction: "{instruction}"
+
+            Please process the following text according to the user's instruction.
+            If the instruction is a question, answer it based on the text.
+            If it's a summary request, summarize accordingly.
+
+            Text Content from Database:
+            {text}
+            """
+
+SUMMARY_PROMPT = """
+            Please summarize the following text in Korean.
+            Capture the main points and key takeaways.
+
+            Text:
+            {text}
+            """
+
+# Map step: no part numbers in the prompt, so an unchanged chunk hits the cache across runs
+MAP_PROMPT = """
+            You are helping build a report from a large Notion workspace that was split into several parts.
+
+            User's Instruction: "{instruction}"
+
+            Extract everything from this part that is relevant to the instruction, as concise notes in Korean.
+            Keep page titles, dates and concrete details; they will be merged with the notes of the other parts.
+
+            Text Content (one part of the database):
+            {text}
+            """
+
+MERGE_PROMPT = """
+            You are a helpful assistant maximizing the utility of the user's Notion database.
+            The notes below were extracted from different parts of the database.
+
+            User's Instruction: "{instruction}"
+
+            Merge the notes below into one set of notes, removing duplicates but keeping every relevant detail.
+
+            Notes:
+            {text}
+            """
+
+FINAL_MERGE_PROMPT = """
+            You are a helpful assistant maximizing the utility of the user's Notion database.
+            The notes below were extracted from different parts of the database.
+
+            User's Instruction: "{instruction}"
+
+            Write the final answer to the user's instruction using all the notes below.
+            If the instruction is a question, answer it. If it's a summary request, summarize accordingly.
+
+            Notes:
+            {text}
+            """
+
+DEFAULT_INSTRUCTION = "Summarize the content in Korean. Capture the main points and key takeaways."
+
+
+class SummarizationError(Exception):
+    pass
+
+
+def _used_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
 
 class GeminiSummarizer:
-    def __init__(self):
-        api_key = os.environ["GEMINI_API_KEY"]
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY is not set in environment variables")
-        
-        # New SDK Client
-        self.client = genai.Client(api_key=api_key)
+    def __init__(self, chunk_tokens=100_000, max_workers=4, reduce_fan_in=8, cache=None, client=None,
+                 model_limits=None, hedge_after=None):
+        """
+        chunk_tokens: token budget of a single request; larger input is summarized map-reduce style.
+        max_workers: number of chunk/reduce requests sent concurrently.
+        reduce_fan_in: how many partial summaries are merged by one reduce request.
+        cache: optional ResponseCache; identical requests (model, prompt, instruction, text) are answered from it.
+        client: optional genai-compatible client (e.g. fake_gemini.FakeGenaiClient for offline benchmarks).
+        model_limits: optional {model: (rpm, tpm)} quotas for the scheduler (see quota.parse_limits).
+        hedge_after: seconds before a slow request is duplicated on another model/key (None: adaptive, 0: off).
+        """
+        if client is None:
+            # Several keys (GEMINI_API_KEYS=key1,key2) give the scheduler more quota to route over
+            api_keys = [key.strip() for key in os.environ.get("GEMINI_API_KEYS", "").split(",") if key.strip()]
+            if not api_keys:
+                api_keys = [os.environ.get("GEMINI_API_KEY", "")]
+            if not api_keys[0]:
+                raise ValueError("GEMINI_API_KEY is not set in environment variables")
+
+            # New SDK Client
+            clients = [genai.Client(api_key=api_key) for api_key in api_keys]
+        else:
+            clients = [client]
+        self.client = clients[0]
+        # Preferred model: names the cache keys and the budget plan, whichever model answers
         self.model_name = 'gemini-3-flash-preview' # Default to 3 Flash as requested
+        self.fallback_models = ['gemini-2.5-flash']
         self.logger = logging.getLogger(__name__)
 
+        self.chunk_tokens = chunk_tokens
+        self.max_workers = max(1, max_workers)
+        self.reduce_fan_in = max(2, reduce_fan_in)
+        self.cache = cache
+        self.estimator = TokenEstimator()
+        self.scheduler = QuotaScheduler.for_models(
+            [self.model_name, *self.fallback_models], clients, limits=model_limits, hedge_after=hedge_after)
+
     def summarize(self, text, user_instruction=None):
         """
         Sends text to Gemini for summarization using google-genai SDK.
+        Text over the chunk budget is split on paragraph boundaries and summarized map-reduce style.
         """
         if not text or len(text.strip()) == 0:
             return "No content to summarize."
 
+        if self.estimator.estimate(text) > self.chunk_tokens:
+            return self.summarize_documents(text.split("\n\n"), user_instruction=user_instruction)
+
+        try:
+            return self.summarize_single(text, user_instruction)
+        except SummarizationError as e:
+            return str(e)
+
+    def summarize_documents(self, documents, user_instruction=None):
+        """
+        Summarizes documents (e.g. one per page; a list, CorpusBuilder or any iterable).
+        Documents are packed into token-budgeted chunks without splitting a page unless it alone
+        exceeds the budget. Chunks are summarized concurrently (map), then the partial results are
+        merged reduce_fan_in at a time until one report is left (reduce).
+        Chunks are built lazily, so only the ones being summarized are held in memory.
+        """
+        try:
+            single, chunks = self._peek_chunks(documents)
+            if single is not None:
+                return self.summarize_single(single, user_instruction)
+            if chunks is None:
+                return "No content to summarize."
+
+            partials = self._map_chunks(chunks, user_instruction)
+            return self.reduce_partials(partials, user_instruction)
+        except SummarizationError as e:
+            return str(e)
+
+    def summarize_documents_stream(self, documents, user_instruction=None):
+        """
+        Streaming variant of summarize_documents: yields the final report text as Gemini generates it.
+        In map-reduce mode the map and intermediate reduce passes run as usual and only the final
+        merge is streamed. Raises SummarizationError on failure.
+        """
+        single, chunks = self._peek_chunks(documents)
+        if single is not None:
+            if user_instruction:
+                yield from self._generate_stream(INSTRUCTION_PROMPT, single, user_instruction)
+            else:
+                yield from self._generate_stream(SUMMARY_PROMPT, single)
+            return
+        if chunks is None:
+            yield "No content to summarize."
+            return
+
+        partials = self._map_chunks(chunks, user_instruction)
+        partials = self._reduce_until_final(partials, user_instruction)
+        yield from self._generate_stream(FINAL_MERGE_PROMPT, self._join_parts(partials), user_instruction or DEFAULT_INSTRUCTION)
+
+    def _peek_chunks(self, documents):
+        """
+        Looks at the first two chunks to choose the mode without building the rest.
+        Returns (single_chunk, None) for one-shot, (None, chunk_iterator) for map-reduce,
+        or (None, None) when there is nothing to summarize.
+        """
+        chunk_iter = self.iter_chunks(documents)
+        first = next(chunk_iter, None)
+        if first is None:
+            return None, None
+        second = next(chunk_iter, None)
+        if second is None:
+            return first, None
+        return None, itertools.chain([first, second], chunk_iter)
+
+    def _map_chunks(self, chunks, user_instruction):
+        """
+        Map phase over a lazy chunk iterator: at most max_workers chunks are in flight
+        (and in memory) at a time. Returns partial results in chunk order.
+        """
+        self.logger.info(f"Map phase: summarizing chunks ({self.max_workers} in parallel)...")
+        in_flight = threading.BoundedSemaphore(self.max_workers)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk in chunks:
+                in_flight.acquire()
+                future = executor.submit(self.summarize_chunk, chunk, user_instruction)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+            self.logger.info(f"Map phase: {len(futures)} chunks submitted.")
+            return [future.result() for future in futures]
+
+    def plan(self, documents, titles=None, max_tokens=None, page_tokens=None):
+        """
+        Token accounting before the run: per-page and total tokens, requests and projected cost.
+        With max_tokens, whole pages are kept in order while they fit (see token_budget.apply_budget);
+        pass plan.kept to select the documents to send.
+        documents must be re-iterable (list or CorpusBuilder); page_tokens may be passed if already known.
+        """
+        if page_tokens is None:
+            page_tokens = [
+                (titles[i] if titles else f"Document {i + 1}", self.estimator.estimate(doc))
+                for i, doc in enumerate(documents)
+            ]
+        kept, dropped = apply_budget(page_tokens, max_tokens)
+        kept_set = set(kept)
+        kept_documents = (doc for i, doc in enumerate(documents) if i in kept_set)
+        chunk_count = sum(1 for _ in self.iter_chunks(kept_documents))
+        return BudgetPlan(
+            page_tokens, kept, dropped,
+            map_requests=chunk_count,
+            reduce_requests=count_reduce_requests(chunk_count, self.reduce_fan_in),
+            model_name=self.model_name
+        )
+
+    def calibrate_estimator(self, documents, sample_count=5):
+        """
+        Calibrates the local token estimate against the SDK's count_tokens using a few documents.
+        """
+        samples = list(itertools.islice(iter(documents), sample_count))
+        return self.estimator.calibrate(self.client, self.model_name, samples)
+
+    def summarize_chunk(self, chunk, user_instruction):
+        """
+        Map step: extracts notes relevant to the instruction from one chunk. Raises SummarizationError.
+        """
+        return self._generate(MAP_PROMPT, chunk, user_instruction or DEFAULT_INSTRUCTION)
+
+    def reduce_partials(self, partials, user_instruction):
+        """
+        Reduce step: merges partial results in one or more passes of at most reduce_fan_in inputs each.
+        Raises SummarizationError.
+        """
+        partials = self._reduce_until_final(partials, user_instruction)
+        return self._generate(FINAL_MERGE_PROMPT, self._join_parts(partials), user_instruction or DEFAULT_INSTRUCTION)
+
+    def _reduce_until_final(self, partials, user_instruction):
+        """
+        Runs intermediate reduce passes until the rest fits in one final merge.
+        """
+        while len(partials) > self.reduce_fan_in:
+            groups = [partials[i:i + self.reduce_fan_in] for i in range(0, len(partials), self.reduce_fan_in)]
+            self.logger.info(f"Reduce phase: merging {len(partials)} partial results into {len(groups)}...")
+            partials = self._run_parallel(
+                lambda i: self._generate(MERGE_PROMPT, self._join_parts(groups[i]), user_instruction or DEFAULT_INSTRUCTION),
+                len(groups)
+            )
+        self.logger.info(f"Reduce phase: merging {len(partials)} partial results into the final report...")
+        return partials
+
+    @staticmethod
+    def _join_parts(parts):
+        return "\n\n".join(f"[Part {i + 1}]\n{part}" for i, part in enumerate(parts))
+
+    def _run_parallel(self, fn, count):
+        """
+        Runs fn(0..count-1) on a bounded thread pool and returns results in index order.
+        """
+        if count == 1:
+            return [fn(0)]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, count)) as executor:
+            return list(executor.map(fn, range(count)))
+
+    def iter_chunks(self, documents):
+        """
+        Packs documents into chunks of at most chunk_tokens (estimated), on document boundaries,
+        yielding each chunk as soon as it is closed (documents may be a lazy iterator).
+        A single document over the budget is split on line boundaries.
+        """
+        current, current_tokens = [], 0
+        for doc in documents:
+            if not doc or not doc.strip():
+                continue
+            doc_tokens = self.estimator.estimate(doc)
+            pieces = [(doc, doc_tokens)] if doc_tokens <= self.chunk_tokens else self._split_long_text(doc)
+            for piece, piece_tokens in pieces:
+                if current and current_tokens + piece_tokens > self.chunk_tokens:
+                    yield "\n\n".join(current)
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+                # Content-defined boundary: once the chunk is half full, close it after a document
+                # whose hash matches. Boundaries then follow content rather than position, so one
+                # edited page only changes the chunks around it and the rest stay cacheable.
+                if current_tokens >= self.chunk_tokens // 2 and zlib.crc32(piece.encode("utf-8")) % 8 == 0:
+                    yield "\n\n".join(current)
+                    current, current_tokens = [], 0
+        if current:
+            yield "\n\n".join(current)
+
+    def _split_long_text(self, text):
+        pieces = []
+        current, current_tokens = [], 0
+        for line in text.split("\n"):
+            line_tokens = self.estimator.estimate(line)
+            if current and current_tokens + line_tokens > self.chunk_tokens:
+                pieces.append(("\n".join(current), current_tokens))
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += line_tokens
+        if current:
+            pieces.append(("\n".join(current), current_tokens))
+        return pieces
+
+    def summarize_single(self, text, user_instruction):
+        """
+        One-shot request for input that fits in a single chunk. Raises SummarizationError.
+        """
         # Construct Prompt
         if user_instruction:
-            prompt = f"""
-            You are a helpful assistant maximizing the utility of the user's Notion database.
-            
-            User's Instruction: "{user_instruction}"
-            
-            Please process the following text according to the user's instruction.
-            If the instruction is a question, answer it based on the text.
-            If it's a summary request, summarize accordingly.
-            
-            Text Content from Database:
-            {text[:1000000]} 
-            """
-        else:
-            prompt = f"""
-            Please summarize the following text in Korean. 
-            Capture the main points and key takeaways.
-            
-            Text:
-            {text[:1000000]} 
-            """ 
-        
-        # Retry Logic
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                self.logger.info(f"Sending request to Gemini ({self.model_name})...")
-                # New SDK Usage
-                response = self.client.models.generate_content(
-                    model=self.model_name,
+            return self._generate(INSTRUCTION_PROMPT, text, user_instruction)
+        return self._generate(SUMMARY_PROMPT, text)
+
+    def _generate(self, template, text, instruction=""):
+        """
+        Single Gemini call with quota handling. Raises SummarizationError on failure.
+        Responses are looked up in / stored to the response cache when one is set.
+        """
+        cached = self._cached_response(template, instruction, text)
+        if cached is not None:
+            return cached
+
+        prompt = template.format(instruction=instruction, text=text)
+
+        def request(lane):
+            self.logger.info(f"Sending request to Gemini ({lane.label})...")
+            # New SDK Usage
+            with metrics.stage(f"gemini.generate[{lane.model}]"):
+                response = lane.client.models.generate_content(
+                    model=lane.model,
                     contents=prompt
                 )
-                return response.text
+            metrics.record_usage(lane.model, getattr(response, "usage_metadata", None))
+            return response
+
+        # The scheduler picks a model/key with quota left and reroutes on 429s
+        try:
+            lane, response = self.scheduler.call(request, self._request_tokens(prompt), used_tokens=_used_tokens)
+        except Exception as e:
+            if is_quota_error(e):
+                raise SummarizationError("Failed to generate summary after retries (Quota Limit).")
+            self.logger.error(f"Error generating summary: {e}")
+            raise SummarizationError(f"Failed to generate summary: {e}")
+        if self.cache and response.text:
+            # Keyed by the model that answered, so a fallback answer never poses as the preferred one's
+            self.cache.put(response_key(lane.model, template, instruction, text), response.text, lane.model)
+        return response.text
+
+    def _cached_response(self, template, instruction, text):
+        """
+        Cached response for this request: the preferred model's first, else a fallback model's.
+        """
+        if not self.cache:
+            return None
+        for model in self.scheduler.models:
+            cached = self.cache.get(response_key(model, template, instruction, text))
+            if cached is not None:
+                self.logger.info(f"Using cached Gemini response ({model}).")
+                metrics.count("gemini.cache_hits")
+                return cached
+        return None
+
+    def _generate_stream(self, template, text, instruction=""):
+        """
+        Streaming Gemini call (generate_content_stream): yields text pieces as they arrive.
+        Quota errors before the first piece are retried like _generate; once output has been
+        yielded a failure can't be retried without duplicating text, so it raises.
+        """
+        cached = self._cached_response(template, instruction, text)
+        if cached is not None:
+            yield cached
+            return
+
+        prompt = template.format(instruction=instruction, text=text)
+        tokens = self._request_tokens(prompt)
+
+        # A stream can't be hedged (its text is already on its way), but it is routed the same way
+        for attempt in range(self.scheduler.max_attempts):
+            lane, entry = self.scheduler.acquire(tokens)
+            received = []
+            settled = False
+            try:
+                self.logger.info(f"Streaming request to Gemini ({lane.label})...")
+                started = time.perf_counter()
+                usage = None
+                for chunk in lane.client.models.generate_content_stream(
+                    model=lane.model,
+                    contents=prompt
+                ):
+                    # Usage is reported on the stream's chunks (complete on the last one)
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.text:
+                        received.append(chunk.text)
+                        yield chunk.text
+                elapsed = time.perf_counter() - started
+                metrics.add_time(f"gemini.stream[{lane.model}]", elapsed)
+                metrics.record_usage(lane.model, usage)
+                self.scheduler.release(lane, entry, tokens=getattr(usage, "total_token_count", None), latency=elapsed)
+                settled = True
+                if self.cache and received:
+                    self.cache.put(response_key(lane.model, template, instruction, text), "".join(received), lane.model)
+                return
             except Exception as e:
-                # Check for Quota Limit (429)
-                error_str = str(e)
-                if "429" in error_str or "Quota" in error_str or "quota" in error_str:
-                    # Model Fallback Logic
-                    if self.model_name == 'gemini-3-flash-preview':
-                        self.logger.warning("⚠️ Gemini 3.0 Flash Quota Exceeded. Switching to 2.5 Flash...")
-                        self.model_name = 'gemini-2.5-flash'
-                        continue # Retry immediately with new model
-                        
-                    wait_time = 60
-                    self.logger.warning(f"⚠️ Gemini API Quota exceeded (Attempt {attempt+1}/{max_retries}).")
-                    self.logger.warning(f"   Waiting {wait_time} seconds before retrying...")
-                    time.sleep(wait_time)
-                    continue
-                else:
+                self.scheduler.release(lane, entry, error=e)
+                settled = True
+                if received or not is_quota_error(e):
                     self.logger.error(f"Error generating summary: {e}")
-                    return f"Failed to generate summary: {e}"
-        
-        return "Failed to generate summary after retries (Quota Limit)."
+                    raise SummarizationError(f"Failed to generate summary: {e}")
+                self.logger.warning(f"Gemini quota exceeded (attempt {attempt + 1}/{self.scheduler.max_attempts}), rerouting...")
+            finally:
+                # The consumer stopped reading mid-stream
+                if not settled:
+                    self.scheduler.release(lane, entry)
+
+        raise SummarizationError("Failed to generate summary after retries (Quota Limit).")
+
+    def _request_tokens(self, prompt):
+        # What a request counts against a TPM quota: its prompt plus a typical answer
+        return self.estimator.estimate(prompt) + EXPECTED_OUTPUT_TOKENS
+
+    def close(self):
+        self.scheduler.close()
@@ -0,0 +1,141 @@
+import logging
+import math
+import re
+
+# Hangul syllables/jamo: roughly one token per character. Other text: roughly 4 characters per token.
+_HANGUL_RE = re.compile(r"[ᄀ-ᇿ㄰-㆏가-힣]")
+
+# USD per 1M tokens (input, output). Used only for the pre-run estimate; update when pricing changes.
+MODEL_PRICING = {
+    "gemini-3-flash-preview": (0.50, 3.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+}
+
+# Assumed response length per request when projecting cost
+EXPECTED_OUTPUT_TOKENS = 2_000
+
+
+def estimate_tokens(text):
+    """
+    Rough token estimate (no API call). Character count is a poor proxy for Korean text,
+    so Hangul and other characters are weighted separately.
+    """
+    if not text:
+        return 0
+    hangul = len(_HANGUL_RE.findall(text))
+    return hangul + (len(text) - hangul) // 4 + 1
+
+
+class TokenEstimator:
+    """
+    Fast local token estimator with an optional calibration factor
+    measured against the SDK's count_tokens.
+    """
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.logger = logging.getLogger(__name__)
+
+    def estimate(self, text):
+        return int(math.ceil(estimate_tokens(text) * self.scale))
+
+    def calibrate(self, client, model_name, samples):
+        """
+        Counts a few sample texts with the real tokenizer and scales local estimates to match.
+        Keeps the previous scale if counting fails (e.g. offline).
+        """
+        sample = "\n\n".join(s for s in samples if s)
+        local = estimate_tokens(sample)
+        if not local:
+            return self.scale
+        try:
+            counted = client.models.count_tokens(model=model_name, contents=sample).total_tokens
+        except Exception as e:
+            self.logger.warning(f"Token calibration failed, using local estimate: {e}")
+            return self.scale
+        if counted:
+            self.scale = counted / local
+            self.logger.info(f"Calibrated token estimate against {model_name}: x{self.scale:.2f}")
+        return self.scale
+
+
+class BudgetPlan:
+    """
+    Pre-run token report: per-page and total tokens, pages kept under the budget,
+    number of Gemini requests and projected cost.
+    """
+    def __init__(self, page_tokens, kept, dropped, map_requests, reduce_requests, model_name):
+        self.page_tokens = page_tokens # [(title, tokens)] in input order
+        self.kept = kept # indexes of pages that fit in the budget
+        self.dropped = dropped # indexes of pages left out by the budget
+        self.map_requests = map_requests
+        self.reduce_requests = reduce_requests
+        self.model_name = model_name
+
+    @property
+    def total_tokens(self):
+        return sum(tokens for _, tokens in self.page_tokens)
+
+    @property
+    def kept_tokens(self):
+        return sum(self.page_tokens[i][1] for i in self.kept)
+
+    @property
+    def requests(self):
+        return self.map_requests + self.reduce_requests
+
+    @property
+    def projected_cost(self):
+        """
+        USD estimate: all kept tokens are read once by the map (or single) requests;
+        reduce requests read the previous outputs.
+        """
+        price_in, price_out = MODEL_PRICING.get(self.model_name, (0.0, 0.0))
+        input_tokens = self.kept_tokens + self.reduce_requests * EXPECTED_OUTPUT_TOKENS * 2
+        output_tokens = self.requests * EXPECTED_OUTPUT_TOKENS
+        return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+    def report(self, top=10):
+        """
+        Human-readable summary (the largest pages, totals, requests, cost).
+        """
+        lines = [f"Token plan ({self.model_name}): {len(self.page_tokens)} pages, ~{self.total_tokens:,} tokens total"]
+        largest = sorted(range(len(self.page_tokens)), key=lambda i: -self.page_tokens[i][1])[:top]
+        for i in largest:
+            title, tokens = self.page_tokens[i]
+            lines.append(f"   {tokens:>10,}  {title}")
+        if self.dropped:
+            lines.append(f"   Budget keeps {len(self.kept)} pages (~{self.kept_tokens:,} tokens), "
+                         f"skips {len(self.dropped)} pages")
+        lines.append(f"   Requests: {self.requests} ({self.map_requests} map/single + {self.reduce_requests} reduce)")
+        lines.append(f"   Projected cost: ~${self.projected_cost:.4f}")
+        return "\n".join(lines)
+
+
+def apply_budget(page_tokens, max_tokens=None):
+    """
+    Keeps whole pages, in order, while they fit in max_tokens. Pages are never cut mid-page;
+    a page that doesn't fit is skipped and later smaller pages may still be kept.
+    Returns (kept indexes, dropped indexes).
+    """
+    if not max_tokens:
+        return list(range(len(page_tokens))), []
+    kept, dropped = [], []
+    used = 0
+    for i, (_, tokens) in enumerate(page_tokens):
+        if used + tokens <= max_tokens:
+            kept.append(i)
+            used += tokens
+        else:
+            dropped.append(i)
+    return kept, dropped
+
+
+def count_reduce_requests(partials, fan_in):
+    """
+    Number of reduce requests needed to merge `partials` results fan_in at a time.
+    """
+    requests = 0
+    while partials > 1:
+        partials = math.ceil(partials / fan_in)
+        requests += partials
+    return requests
@@ -0,0 +1,176 @@
+import logging
+import signal
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from cache import PageCache, WatchState
+from main import build_parser, connector_options, create_summarizer, export_metrics
+from metrics import metrics
+from notion_connector import NotionConnector, parse_time
+from per_page import PerPageRunner
+
+logger = logging.getLogger("watcher")
+
+# Notion reports last_edited_time rounded to the minute, so each poll looks back a little further;
+# pages seen twice are skipped by the summary index (content hash unchanged)
+POLL_OVERLAP = timedelta(minutes=2)
+
+
+def parse_args(argv=None):
+    parser = build_parser()
+    parser.description = "Notion AI Assistant - watch mode: summarize new and changed pages as they land"
+    parser.add_argument("--instruction", required=True,
+                        help="Instruction used for every page summary")
+    parser.add_argument("--source-id", default=None,
+                        help="Database/page to watch (defaults to NOTION_DATABASE_ID)")
+    parser.add_argument("--poll-interval", type=float, default=60.0,
+                        help="Seconds between polls")
+    parser.add_argument("--debounce", type=float, default=120.0,
+                        help="Seconds a page must stay unedited before it is summarized")
+    parser.add_argument("--since", default=None,
+                        help="ISO time to start from when there is no saved position (default: all pages)")
+    parser.add_argument("--once", action="store_true",
+                        help="Run a single poll and exit (for cron)")
+    args = parser.parse_args(argv)
+    if args.replay or args.save_snapshot:
+        parser.error("--replay/--save-snapshot can't be used in watch mode (it polls live Notion)")
+    return args
+
+
+def _to_iso(value):
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class Watcher:
+    """
+    Long-running incremental summarizer.
+    Every poll lists only pages edited since the persisted high-water mark (server-side
+    last_edited_time filter). Pages edited within the last `debounce` seconds are held back until
+    the burst of edits settles, then summarized per page (PerPageRunner: bounded concurrency,
+    unchanged content skipped). Memory is bounded by the pages waiting in the debounce window.
+    """
+    def __init__(self, notion, summarizer, user_instruction, poll_interval=60.0, debounce=120.0,
+                 concurrency=4, state=None, since=None, prometheus_path=None):
+        self.notion = notion
+        self.user_instruction = user_instruction
+        self.poll_interval = poll_interval
+        self.debounce = timedelta(seconds=debounce)
+        self.state = state or WatchState(notion.source_id)
+        self.runner = PerPageRunner(notion, summarizer, concurrency=concurrency)
+        # Rewritten after every poll so a textfile collector always sees current counters
+        self.prometheus_path = prometheus_path
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+
+        self.pending = {} # page id -> latest page object, waiting for edits to settle
+        saved = self.state.get()
+        self.high_water = parse_time(saved or since)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, once=False):
+        """
+        Polls until stop() (or once). A failed poll is logged and retried on the next interval.
+        """
+        self.logger.info(f"Watching {self.notion.source_id} every {self.poll_interval:.0f}s "
+                         f"(debounce {self.debounce.total_seconds():.0f}s, since {self.high_water or 'the beginning'})")
+        while not self._stop.is_set():
+            try:
+                with metrics.stage("watch_poll"):
+                    self.poll()
+            except Exception as e:
+                self.logger.error(f"Poll failed: {e}")
+                metrics.count("watch.poll_errors")
+            if self.prometheus_path:
+                metrics.write_prometheus(self.prometheus_path)
+            if once:
+                return
+            self._stop.wait(self.poll_interval)
+
+    def poll(self, now=None):
+        """
+        One cycle: list edited pages, summarize those that are quiet, advance the high-water mark.
+        Returns the PerPageRunner result (None if nothing was ready).
+        """
+        now = now or datetime.now(timezone.utc)
+        edited_after = self.high_water - POLL_OVERLAP if self.high_water else None
+        seen_max = self.high_water
+
+        for page in self.notion.iter_unsummarized_pages(edited_after=edited_after):
+            self.pending[page["id"]] = page
+            edited = parse_time(page.get("last_edited_time"))
+            if edited and (seen_max is None or edited > seen_max):
+                seen_max = edited
+
+        ready, waiting = [], {}
+        for page_id, page in self.pending.items():
+            edited = parse_time(page.get("last_edited_time"))
+            if edited and now - edited < self.debounce:
+                waiting[page_id] = page
+            else:
+                ready.append(page)
+        self.pending = waiting
+
+        result = None
+        if ready:
+            self.logger.info(f"{len(ready)} pages changed ({len(waiting)} still being edited), summarizing...")
+            result = self.runner.run(self.user_instruction, pages=ready)
+            metrics.count("watch.pages_summarized", result.get("summarized", 0))
+            if result.get("failed"):
+                # Failed pages are picked up again on the next poll: don't move past them
+                return result
+        elif waiting:
+            self.logger.info(f"{len(waiting)} pages still being edited, waiting for them to settle...")
+
+        # Never move past a page that is still waiting, so a restart doesn't lose it
+        oldest_waiting = min((parse_time(p.get("last_edited_time")) for p in waiting.values()), default=None)
+        new_mark = min(seen_max, oldest_waiting) if oldest_waiting and seen_max else seen_max
+        if new_mark and new_mark != self.high_water:
+            self.high_water = new_mark
+            self.state.set(_to_iso(new_mark))
+        return result
+
+    def close(self):
+        self.runner.close()
+        self.state.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)],
+        force=True
+    )
+
+    if args.dedup or args.top_k is not None or args.min_relevance is not None:
+        logger.warning("Dedup and the relevance filter work on the combined report; they are not applied in watch mode.")
+    notion = NotionConnector(source_id=args.source_id, **connector_options(args))
+    if notion.source_type == "unknown":
+        return 1
+    if not args.no_cache:
+        notion.cache = PageCache(notion.source_id, refresh=args.refresh)
+    summarizer = create_summarizer(args)
+    watcher = Watcher(notion, summarizer, args.instruction, poll_interval=args.poll_interval,
+                      debounce=args.debounce, concurrency=args.concurrency, since=args.since,
+                      prometheus_path=args.prometheus)
+
+    # Ctrl+C / SIGTERM finish the current poll, then exit
+    signal.signal(signal.SIGINT, lambda *_: watcher.stop())
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    try:
+        watcher.run(once=args.once)
+    finally:
+        watcher.close()
+        notion.close()
+        summarizer.close()
+        export_metrics(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())